@@ -26,73 +26,204 @@
 # and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
 # and in China: https://gitee.com/ssb22/scan-reflow
 
-def lsbMsb(dat):
-  tot=0 ; mul=0
-  for d in dat:
-    tot |= (ord(d)<<mul)
-    mul += 8
-  return tot
-def readDoc(docNo,contentsFile,dataFile=None):
-  contentsFile.seek(docNo*4)
-  r1=lsbMsb(contentsFile.read(4))
-  if not dataFile: return r1 # just the position
-  try: r2=lsbMsb(contentsFile.read(4))
-  except EOFError: r2=-1 # read from r1 to EOF
-  dataFile.seek(r1)
-  return dataFile.read(r2-r1)
-imageDat=open("images.dat","rb")
-sequenceDat=open("sequence.dat","rb")
-contentsDat=open("contents.dat","rb")
-numDocs = len(contentsDat.read())/4
+from datfiles import DataFiles
+data = DataFiles()
+numDocs = data.numDocs
 
-from Tkinter import *
-import zlib,thread
+try: from Tkinter import *
+except ImportError: from tkinter import * # Python 3
+try: import thread
+except ImportError: import _thread as thread # Python 3
+try: from Queue import Queue, Empty
+except ImportError: from queue import Queue, Empty # Python 3
+import time
 
-def addViewer(master, docNo, toForget=[], extraText=""):
-  scrollbar = Scrollbar(master)
-  text = Text(master, yscrollcommand=scrollbar.set)
-  scrollbar.config(command=text.yview)
-  for i in toForget: i.pack_forget()
-  scrollbar.pack(side=LEFT,fill=Y,expand=1)
-  text.pack(side=LEFT,fill=BOTH,expand=1)
-  text.theImages = [] # must keep references
-  if extraText: text.insert(END,extraText)
-  if docNo:
-    text.tag_config("p",foreground="blue",underline=1)
-    text.tag_bind("p","<Button-1>", lambda *args:master.selectDocument(docNo-1))
-    text.insert(END, "Previous", "p")
-    text.insert(END,"   ")
-  text.tag_config("n",foreground="blue",underline=1)
-  text.tag_config("m",foreground="blue",underline=1)
-  text.tag_bind("n","<Button-1>", lambda *args:master.selectDocument(docNo+1))
-  thread.start_new_thread(queue_additions,(master,docNo,text))
-  return [text,scrollbar]
+glyphCacheChunks = 5 # chunks' worth of decoded XBM data to keep (the ones on display, and the start of the next document)
+pollBudget = 0.05 # seconds of GUI updates to do per poll
+pollGap = 20 # milliseconds to leave between polls while there's work (so mouse clicks get through)
+idleGap = 100 # milliseconds between polls while waiting for work
+showPollStats = 0 # 1 = print queue latency after each document, for tuning the above
+chunkGlyphs = 100 # glyphs to add to or remove from the display at a time
 
-def queue_additions(master,docNo,text):
-  doc = readDoc(docNo,contentsDat,sequenceDat)
-  for i in range(0,len(doc),2):
-    imgdata = BitmapImage(data=zlib.decompress( readDoc(lsbMsb(doc[i:i+2]),imageDat,imageDat)))
-    text.theImages.append(imgdata) # keep reference
-    master.todo.append( lambda i=i,imgdata=imgdata,*args:(
-        text.image_create(END,image=imgdata),
-        text.insert(END,"   ")))
-  if docNo<numDocs: master.todo.append(lambda *args:text.insert(END, "Next", "n"))
-  master.todo.append(None)
+class GlyphCache:
+  # Least-recently-used cache of decoded glyphs, shared by
+  # the display thread and the prefetch thread.  Its size
+  # limit is in chunks, as the bytes per glyph depend on
+  # the document's glyph sizes (about 20k each at 640x480
+  # with 3 lines), so it's worked out from those decoded
+  def __init__(self,maxChunks):
+    self.maxChunks = maxChunks ; self.size = 0
+    self.decoded = self.decodedBytes = 0 # (for the average)
+    self.glyphs = {} # glyph number -> [last-used tick, XBM text]
+    self.tick = 0 ; self.lock = thread.allocate_lock()
+  def maxBytes(self):
+    return self.maxChunks*chunkGlyphs*self.decodedBytes//max(1,self.decoded)
+  def get(self,glyphNo):
+    self.lock.acquire()
+    try:
+      self.tick += 1 ; g = self.glyphs.get(glyphNo)
+      if g: g[0] = self.tick ; return g[1]
+    finally: self.lock.release()
+    xbm = data.xbm(glyphNo) # (outside the lock: the other thread can carry on)
+    self.lock.acquire()
+    try:
+      self.decoded += 1 ; self.decodedBytes += len(xbm)
+      if not glyphNo in self.glyphs:
+        self.glyphs[glyphNo] = [self.tick,xbm] ; self.size += len(xbm)
+        if self.size > self.maxBytes(): self.evict()
+    finally: self.lock.release()
+    return xbm
+  def prefetch(self,glyphNo):
+    "Decode glyphNo into the cache if there's room without evicting anything; returns 0 if there wasn't"
+    self.lock.acquire()
+    try:
+      if glyphNo in self.glyphs: return 1
+    finally: self.lock.release()
+    xbm = data.xbm(glyphNo)
+    self.lock.acquire()
+    try:
+      self.decoded += 1 ; self.decodedBytes += len(xbm)
+      if glyphNo in self.glyphs: return 1
+      if self.size+len(xbm) > self.maxBytes(): return 0
+      self.glyphs[glyphNo] = [self.tick,xbm] ; self.size += len(xbm)
+      return 1
+    finally: self.lock.release()
+  def evict(self): # down to 3/4 full, so we don't have to sort on every miss
+    ticks = [(g[0],k) for k,g in self.glyphs.items()] ; ticks.sort()
+    maxBytes = self.maxBytes()
+    for t,k in ticks:
+      if self.size <= maxBytes*3//4: break
+      self.size -= len(self.glyphs[k][1]) ; del self.glyphs[k]
+glyphCache = GlyphCache(glyphCacheChunks)
+
+def prefetch(docNo):
+  # decode the start of the next document while this one's
+  # being read (only what Next will show first, and only
+  # while it fits, so it doesn't push out what's on screen)
+  if docNo < numDocs:
+    for g in data.docGlyphs(docNo)[:chunkGlyphs]:
+      if not glyphCache.prefetch(g): break
+
+class Viewer:
+  # Only the chunks of the document near the visible part
+  # are in the Text widget (with marks "chunkN" at the start
+  # of each, between marks "head" and "tail"), so memory
+  # use doesn't grow with the document's length
+  def __init__(self, master, docNo, extraText=""):
+    self.master,self.docNo = master,docNo
+    self.glyphs = data.docGlyphs(docNo)
+    self.numChunks = (len(self.glyphs)+chunkGlyphs-1)//chunkGlyphs
+    self.loaded = {} # chunk number -> {glyph number: BitmapImage} (must keep references)
+    self.busy = self.checkPending = 0 ; self.alive = 1
+    self.scrollbar = scrollbar = Scrollbar(master)
+    self.text = text = Text(master, yscrollcommand=self.onScroll)
+    scrollbar.config(command=text.yview)
+    scrollbar.pack(side=LEFT,fill=Y,expand=1)
+    text.pack(side=LEFT,fill=BOTH,expand=1)
+    if extraText: text.insert(END,extraText)
+    if docNo:
+      text.tag_config("p",foreground="blue",underline=1)
+      text.tag_bind("p","<Button-1>", lambda *args:master.selectDocument(docNo-1))
+      text.insert(END, "Previous", "p")
+      text.insert(END,"   ")
+    text.tag_config("n",foreground="blue",underline=1)
+    text.tag_config("m",foreground="blue",underline=1)
+    text.tag_bind("n","<Button-1>", lambda *args:master.selectDocument(docNo+1))
+    text.mark_set("head","end-1c") ; text.mark_gravity("head",LEFT)
+    if docNo<numDocs:
+      text.insert(END, "Next", "n")
+      text.mark_set("tail","n.first")
+    else: text.mark_set("tail","end-1c")
+    self.check()
+  def close(self):
+    self.alive = 0 ; self.loaded = {}
+    self.text.destroy() ; self.scrollbar.destroy()
+  def onScroll(self,first,last):
+    self.scrollbar.set(first,last)
+    if not self.checkPending:
+      self.checkPending = 1 ; self.text.after_idle(self.check)
+  def chunkAt(self,index):
+    chunks = list(self.loaded.keys()) ; chunks.sort()
+    for c in chunks[1:]:
+      if self.text.compare(index,"<","chunk%d" % c): return c-1
+    return chunks[-1]
+  def check(self):
+    # load the chunks either side of what's visible, and drop the rest
+    self.checkPending = 0
+    if self.busy or not self.alive or not self.numChunks: return
+    text = self.text
+    if not self.loaded: return self.load(0,"tail")
+    top = self.chunkAt("@0,0")
+    want = range(max(0,top-1),min(self.numChunks,self.chunkAt("@0,%d" % text.winfo_height())+2))
+    for c in list(self.loaded.keys()):
+      if c in want: continue
+      if c+1 in self.loaded: end = "chunk%d" % (c+1)
+      else: end = "tail"
+      text.mark_set("view","@0,0") ; text.mark_gravity("view",LEFT)
+      text.delete("chunk%d" % c,end) ; text.mark_unset("chunk%d" % c)
+      del self.loaded[c]
+      if c < top: text.yview("view") # so what's visible doesn't move
+    first,last = min(self.loaded.keys()),max(self.loaded.keys())
+    if want[0] < first:
+      text.mark_set("view","@0,0") ; text.mark_gravity("view",LEFT)
+      text.mark_gravity("chunk%d" % first,RIGHT) # so inserts before it go in order
+      self.load(first-1,"chunk%d" % first)
+    elif want[-1] > last: self.load(last+1,"tail")
+  def load(self,chunk,where):
+    self.busy = 1
+    self.text.mark_set("chunk%d" % chunk,where)
+    self.text.mark_gravity("chunk%d" % chunk,LEFT)
+    self.loaded[chunk] = {}
+    thread.start_new_thread(self.queue_additions,(chunk,where))
+    self.master.wake()
+  def queue_additions(self,chunk,where):
+    images = self.loaded[chunk] ; keepView = (where != "tail")
+    for g in self.glyphs[chunk*chunkGlyphs:(chunk+1)*chunkGlyphs]:
+      imgdata = images.get(g) # same glyph again in this chunk: reuse its image
+      if not imgdata: imgdata = images[g] = BitmapImage(data=glyphCache.get(g))
+      self.master.later(lambda imgdata=imgdata,*args:self.alive and (
+        self.text.image_create(where,image=imgdata),
+        self.text.insert(where,"   "),
+        keepView and self.text.yview("view")))
+    self.master.later(lambda *args:self.loadDone(where))
+    self.master.later(None)
+    if chunk == self.numChunks-1: prefetch(self.docNo+1)
+  def loadDone(self,where):
+    if not self.alive: return
+    if where != "tail": self.text.mark_gravity(where,LEFT)
+    self.busy = 0 ; self.check() # (might want more, if the screen isn't full yet)
 
 class MyApp(Frame):
     def __init__(self,master=None):
         Frame.__init__(self, master) ; self.pack()
-        self.todo = [] ; self.toForget = []
+        self.todo = Queue() ; self.viewer = None
+        self.polling = 0 ; self.resetStats()
+    def later(self,func): # func = None to say no more for now
+        self.todo.put((time.time(),func))
+    def resetStats(self): self.items = self.polls = 0 ; self.totalLatency = self.maxLatency = 0.0
     def poll(self): # only one GUI-accessing thread.  Careful not to do too many things at once - responsiveness problems.  (Mouse clicks can be MISSED when processing things on WinCE.)
-        repoll=1
-        if self.todo:
-            if self.todo[0]: self.todo[0]()
-            elif len(self.todo)==1: repoll=0
-            self.todo=self.todo[1:]
-        if repoll: self.after(100,self.poll)
+        repoll=1 ; busy=0 ; start = time.time()
+        while time.time() < start+pollBudget:
+            try: queued,func = self.todo.get_nowait()
+            except Empty: break
+            if func:
+                func() ; busy=1 ; self.items += 1
+                latency = time.time()-queued
+                self.totalLatency += latency ; self.maxLatency = max(self.maxLatency,latency)
+            elif self.todo.empty() and not (self.viewer and self.viewer.busy): # (if busy, a chunk's thread is about to add more)
+                repoll=0 ; break
+        self.polls += 1
+        if repoll: self.after(busy and pollGap or idleGap,self.poll)
+        else:
+            self.polling = 0
+            if showPollStats and self.items: print ("%d updates in %d polls, latency mean %.3fs max %.3fs" % (self.items,self.polls,self.totalLatency/self.items,self.maxLatency))
+            self.resetStats()
+    def wake(self):
+      if not self.polling:
+        self.polling = 1 ; self.after(pollGap,self.poll)
     def selectDocument(self,docNo,extraText=""):
-      self.after(100,self.poll)
-      self.toForget=addViewer(self,docNo,self.toForget,extraText)
+      if self.viewer: self.viewer.close()
+      self.viewer = Viewer(self,docNo,extraText)
 
 def main(startDocNo=0,extraText=""):
   master = MyApp()
@@ -0,0 +1,88 @@
+# Split the output of tex2mbm.py or tex2mbm-fast.py into
+# self-contained bundles of a few documents each
+# (c) Silas S. Brown 2026.
+
+# (should work in either Python 2 or Python 3)
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+# Each bundle gets its own contents.dat, sequence.dat,
+# .mbm files and images.dat (if there was one), with
+# only the glyphs its documents use, numbered from 0 in
+# order of first appearance.  The bitmaps are copied as
+# they are (.mbm records and images.dat records don't
+# refer to anything outside themselves, apart from the
+# images.dat version 2 dictionary, which is copied too).
+
+import os
+from datfiles import DataFiles, SequenceWriter, ImagesDatWriter, mapFile
+from mbmfile import mbmName, bitmapRanges, writeMBM
+
+def makeBundles(baseFilename,docsPerBundle,glyphsPerMbm,directory="."):
+    """Split contents.dat, sequence.dat, baseFilename*.mbm
+    and images.dat in directory into bundle001, bundle002
+    etc (docsPerBundle documents each) and remove them;
+    returns a list of (bundle directory, files for the
+    device)"""
+    data = DataFiles(directory)
+    mbms = {} # file number -> (data, record ranges)
+    def bitmap(g):
+        f = g // glyphsPerMbm
+        if not f in mbms:
+            m = mapFile(os.path.join(directory,mbmName(baseFilename,f)))
+            mbms[f] = (m,bitmapRanges(m))
+        m,ranges = mbms[f] ; start,end = ranges[g % glyphsPerMbm]
+        return m[start:end]
+    bundles = []
+    for firstDoc in range(0,data.numDocs,docsPerBundle):
+        bundleDir = os.path.join(directory,"bundle%03d" % (len(bundles)+1))
+        if not os.path.isdir(bundleDir): os.mkdir(bundleDir)
+        glyphs = [] ; newNo = {} # old glyph number <-> new
+        seq = SequenceWriter(bundleDir)
+        docs = range(firstDoc,min(firstDoc+docsPerBundle,data.numDocs))
+        for d in docs:
+            seq.startDoc() ; s = []
+            for g in data.docGlyphs(d):
+                if not g in newNo:
+                    newNo[g] = len(glyphs) ; glyphs.append(g)
+                s.append(newNo[g])
+            seq.add(s)
+        seq.close() ; files = []
+        if len(docs) > 1: files.append("contents.dat")
+        else: os.remove(seq.contentsFile)
+        if len(docs) > 1 or seq.count > len(glyphs): files.append("sequence.dat")
+        else: os.remove(seq.seqFile) # all unique
+        for i in range(0,len(glyphs),glyphsPerMbm):
+            f = mbmName(baseFilename,i//glyphsPerMbm)
+            writeMBM(os.path.join(bundleDir,f),[bitmap(g) for g in glyphs[i:i+glyphsPerMbm]])
+            files.append(f)
+        if data.numImages:
+            images = ImagesDatWriter(os.path.join(bundleDir,"images.dat"),data.imagesVersion,len(glyphs))
+            if data.imagesVersion == 2: images.start(prefix=data.prefix)
+            for g in glyphs: images.addRecord(data.image(g))
+            images.close()
+        bundles.append((bundleDir,files))
+    mbms.clear() ; del data # (close the files before removing them)
+    for f in ["contents.dat","sequence.dat","images.dat"]:
+        if os.path.exists(os.path.join(directory,f)): os.remove(os.path.join(directory,f))
+    i = 0
+    while os.path.exists(os.path.join(directory,mbmName(baseFilename,i))):
+        os.remove(os.path.join(directory,mbmName(baseFilename,i))) ; i += 1
+    return bundles
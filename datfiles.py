@@ -0,0 +1,251 @@
+# Read and write the contents.dat, sequence.dat and
+# images.dat files made by tex2mbm.py and tex2mbm-fast.py
+# (c) Silas S. Brown 2009, 2026.
+
+# (should work in Python 2.5+ or Python 3)
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+# contents.dat: 32-bit LSB-first byte offsets into
+#   sequence.dat, one per document
+# sequence.dat: 16-bit LSB-first glyph numbers
+#   (not made if there's only one document and all
+#   its glyphs are different, in which case they're
+#   simply shown in order)
+# sequence.dat (32-bit, if there are more than 65536
+#   glyphs): "SQ32" then 32-bit LSB-first glyph numbers.
+#   The 16-bit version can't start with this, as the
+#   first glyph is always 0.  MbmShow reads only the
+#   16-bit version.  Either way, the offsets in
+#   contents.dat are of bytes in the file.
+# images.dat (version 1): 32-bit LSB-first offsets of each
+#   glyph's data (plus one for the end of the last),
+#   followed by the data (zlib-compressed XBM)
+# images.dat (version 2): "XBMZ", 16-bit version, 32-bit
+#   offset of the index; 32-bit length of the dictionary
+#   stream, then the dictionary stream; then the glyphs,
+#   each being 16-bit width, 16-bit height and the rest of
+#   a deflate stream that starts with the dictionary stream
+#   (its data is the rows of the glyph, packed as in XBM);
+#   then the index, which is a 32-bit count and the offset
+#   of each glyph (plus one for the end of the last).
+#   Starting every glyph's stream with the same dictionary
+#   (samples of other glyphs' rows) is what zlib's preset
+#   dictionaries do, but we can decode it with the copy()
+#   method of a decompressobj that's already read the
+#   dictionary stream, which works in Python 2.5 too.
+
+# The files are memory-mapped and the tables are used in
+# place, so opening a document costs a fixed number of
+# I/O calls however many glyphs it has.
+
+import os, sys, re, mmap, struct, zlib
+from array import array
+
+def lsbmsb16(num): return struct.pack("<H",num)
+def lsbmsb32(num): return struct.pack("<I",num)
+
+def parseXBM(xbm):
+    "Width, height and packed rows of XBM text"
+    if not type(xbm)==type(""): xbm = xbm.decode("latin1") # Python 3
+    w = int(re.search("_width[ \t]+([0-9]+)",xbm).group(1))
+    h = int(re.search("_height[ \t]+([0-9]+)",xbm).group(1))
+    rows = array('B',[int(x,16) for x in re.findall("0[xX]([0-9a-fA-F]+)",xbm[xbm.index("{"):])])
+    try: return w,h,rows.tobytes()
+    except AttributeError: return w,h,rows.tostring() # Python 2
+
+magic2 = "XBMZ".encode("latin1") # (no b"" in Python 2.5)
+magicSeq32 = "SQ32".encode("latin1")
+empty = magic2[:0]
+
+hexBytes = ["0x%02x" % i for i in range(256)]
+def makeXBM(w,h,rows):
+    "XBM text (as used by Tk's BitmapImage) from width, height and packed rows"
+    try: hexList = "0x"+rows.hex(",").replace(",",",0x") # Python 3.8+ (much faster)
+    except (AttributeError,TypeError): hexList = ",".join([hexBytes[b] for b in array('B',rows)])
+    return "#define g_width %d\n#define g_height %d\nstatic char g_bits[] = {\n%s};\n" % (w,h,hexList)
+
+def trainDictionary(glyphRows,size=32000):
+    "Samples of glyphRows spread over the whole set, to use as a preset dictionary"
+    total = sum([len(r) for r in glyphRows])
+    if total <= size: return empty.join(glyphRows)
+    step = float(total)/size ; d = [] ; dLen = 0 ; i = 0.0
+    while dLen < size and int(i) < len(glyphRows):
+        # take whole glyphs at intervals (a glyph's rows only repeat as a unit)
+        r = glyphRows[int(i)] ; d.append(r) ; dLen += len(r)
+        i += step
+    return empty.join(d)[-size:] # (deflate can only refer back 32k)
+
+class ImagesDatWriter:
+    # Writes images.dat a glyph at a time, so the glyphs
+    # needn't all be in memory.  Version 1 needs the count
+    # in advance (its offsets come first); version 2 keeps
+    # the first 32k or so of glyphs to make its dictionary
+    # from, unless given one.
+    def __init__(self,fname,version=2,count=None,dictionary=None):
+        self.o = open(fname,"wb") ; self.version = version
+        self.offsets = [] ; self.pending = [] ; self.pendingBytes = 0
+        self.started = False ; self.count = count
+        if version == 1: self.o.write(lsbmsb32(0)*(count+1)) # (filled in by close)
+        elif dictionary is not None: self.start(dictionary)
+    def start(self,dictionary=None,prefix=None):
+        """Write the version 2 header, with a dictionary
+        stream made from dictionary, or else the prefix
+        (dictionary stream) of another images.dat, so that
+        its glyphs can be copied with addRecord"""
+        if prefix is None:
+            self.c = zlib.compressobj(9)
+            prefix = self.c.compress(dictionary) + self.c.flush(zlib.Z_SYNC_FLUSH)
+        self.o.write(magic2+struct.pack("<HI",2,0)+lsbmsb32(len(prefix))+prefix) # (index offset filled in by close)
+        self.started = True
+    def add(self,w,h,rows):
+        "Add a glyph of width w, height h and packed rows"
+        if self.version == 1:
+            self.offsets.append(self.o.tell())
+            self.o.write(zlib.compress(makeXBM(w,h,rows).encode("latin1")))
+        elif not self.started:
+            self.pending.append((w,h,rows)) ; self.pendingBytes += len(rows)
+            if self.pendingBytes >= 32000: self.flushPending()
+        else:
+            self.offsets.append(self.o.tell()) ; g = self.c.copy()
+            self.o.write(struct.pack("<HH",w,h)+g.compress(rows)+g.flush())
+    def addRecord(self,record):
+        "Add a glyph as it was in another images.dat of the same version (see start)"
+        self.offsets.append(self.o.tell()) ; self.o.write(record)
+    def flushPending(self):
+        self.start(trainDictionary([rows for w,h,rows in self.pending]))
+        pending,self.pending = self.pending,[]
+        for w,h,rows in pending: self.add(w,h,rows)
+    def close(self):
+        if self.version == 1:
+            assert len(self.offsets) == self.count, "ImagesDatWriter was given the wrong count"
+            self.offsets.append(self.o.tell()) ; self.o.seek(0)
+            self.o.write(empty.join([lsbmsb32(x) for x in self.offsets]))
+        else:
+            if not self.started: self.flushPending()
+            self.offsets.append(self.o.tell())
+            self.o.write(lsbmsb32(len(self.offsets)-1)+empty.join([lsbmsb32(x) for x in self.offsets]))
+            self.o.seek(6) ; self.o.write(lsbmsb32(self.offsets[-1]))
+        self.o.close()
+
+class SequenceWriter:
+    # Writes sequence.dat and contents.dat in directory.
+    # The glyph numbers are 16-bit until one doesn't fit,
+    # when what's been written so far is redone in 32-bit.
+    def __init__(self,directory="."):
+        self.seqFile = os.path.join(directory,"sequence.dat")
+        self.contentsFile = os.path.join(directory,"contents.dat")
+        self.o = open(self.seqFile,"wb") ; self.wide = False
+        self.contents = [] ; self.count = 0
+    def startDoc(self): self.contents.append(self.o.tell())
+    def add(self,glyphNos):
+        "Add a list of glyph numbers to the current document"
+        if not glyphNos: return
+        if not self.wide and max(glyphNos) > 0xFFFF: self.widen()
+        if self.wide: fmt = "<%dI"
+        else: fmt = "<%dH"
+        self.o.write(struct.pack(fmt % len(glyphNos),*glyphNos))
+        self.count += len(glyphNos)
+    def widen(self):
+        self.o.close() ; old = open(self.seqFile,"rb").read()
+        self.o = open(self.seqFile,"wb") ; self.o.write(magicSeq32)
+        glyphNos = list(table(old,2))
+        self.o.write(struct.pack("<%dI" % len(glyphNos),*glyphNos))
+        self.contents = [len(magicSeq32)+c*2 for c in self.contents]
+        self.wide = True
+    def close(self):
+        self.o.close()
+        o = open(self.contentsFile,"wb")
+        o.write(empty.join([lsbmsb32(c) for c in self.contents])) ; o.close()
+
+def writeImagesDat2(fname,glyphs):
+    "Write version 2 of images.dat from a list of (width,height,rows), with a dictionary made from all of them"
+    w = ImagesDatWriter(fname,2,dictionary=trainDictionary([rows for w,h,rows in glyphs]))
+    for g in glyphs: w.add(*g)
+    w.close()
+
+def mapFile(fname):
+    "Contents of fname without reading it (or None if it doesn't exist)"
+    try: f = open(fname,"rb")
+    except IOError: return None
+    try: return mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+    except (ValueError,EnvironmentError): return f.read() # empty file, or can't mmap here
+
+zeroCopy = sys.version_info >= (3,3) # memoryview.cast
+
+def table(buf,size,start=0,end=None):
+    "LSB-first unsigned integers of size bytes in buf[start:end], as a sequence"
+    if end is None: end = len(buf)
+    end -= (end-start) % size
+    for typecode in "HIL":
+        if array(typecode).itemsize == size: break
+    if zeroCopy and sys.byteorder=="little": return memoryview(buf)[start:end].cast(typecode)
+    a = array(typecode)
+    try: a.frombytes(buf[start:end])
+    except AttributeError: a.fromstring(buf[start:end]) # Python 2
+    if sys.byteorder=="big": a.byteswap()
+    return a
+
+class DataFiles:
+    def __init__(self,directory="."):
+        def p(f): return os.path.join(directory,f)
+        self.imageDat = mapFile(p("images.dat"))
+        self.imagesVersion = 1
+        if self.imageDat and self.imageDat[:4]==magic2:
+            self.imagesVersion,index = struct.unpack("<HI",self.imageDat[4:10])
+            prefixLen = table(self.imageDat,4,10,14)[0]
+            self.prefix = self.imageDat[14:14+prefixLen]
+            self.primed = zlib.decompressobj()
+            self.primed.decompress(self.prefix)
+            self.numImages = table(self.imageDat,4,index,index+4)[0]
+            self.imageOffsets = table(self.imageDat,4,index+4,index+4*(self.numImages+2))
+        elif self.imageDat:
+            self.numImages = table(self.imageDat,4,0,4)[0]//4 - 1
+            self.imageOffsets = table(self.imageDat,4,0,4*(self.numImages+1))
+        else: self.numImages = 0
+        self.sequenceDat = mapFile(p("sequence.dat"))
+        self.seqStart,self.seqWidth = 0,2
+        if self.sequenceDat is None: self.sequence = range(self.numImages) # all unique
+        else:
+            if self.sequenceDat[:4]==magicSeq32: self.seqStart,self.seqWidth = 4,4
+            self.sequence = table(self.sequenceDat,self.seqWidth,self.seqStart)
+        contentsDat = mapFile(p("contents.dat"))
+        if contentsDat is None: self.contents = [0] # only 1 document
+        else: self.contents = table(contentsDat,4)
+        self.numDocs = len(self.contents)
+    def docGlyphs(self,docNo):
+        "The glyph numbers of document docNo"
+        start = (self.contents[docNo]-self.seqStart)//self.seqWidth
+        if docNo+1 < self.numDocs: return self.sequence[start:(self.contents[docNo+1]-self.seqStart)//self.seqWidth]
+        else: return self.sequence[start:]
+    def image(self,glyphNo):
+        "The compressed data of glyph glyphNo (a view, where possible)"
+        start,end = self.imageOffsets[glyphNo],self.imageOffsets[glyphNo+1]
+        if zeroCopy: return memoryview(self.imageDat)[start:end]
+        return self.imageDat[start:end]
+    def xbm(self,glyphNo):
+        "The XBM text of glyph glyphNo"
+        if self.imagesVersion == 1:
+            xbm = zlib.decompress(self.image(glyphNo))
+            if not type(xbm)==type(""): xbm = xbm.decode("latin1") # Python 3
+            return xbm
+        data = self.image(glyphNo)
+        w,h = struct.unpack("<HH",data[:4])
+        return makeXBM(w,h,self.primed.copy().decompress(data[4:]))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# (should work in either Python 2 or Python 3)
+
+# edit-reflow-bench.py: time edit-reflow.py's processing
+# on synthetic documents of 10k, 100k and 1M words
+# (c) Silas S. Brown 2026.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+"""Usage: python edit-reflow-bench.py [--save] [--tolerance=1.5] [sizes...]
+
+Generates an enlarged.tex of each size (default 10000 100000 1000000
+words) with a matching edit script, and times parsing, command
+application and sequence.dat writing separately.
+
+With --save, the times are stored in edit-reflow-bench.baseline as the
+baseline.  Otherwise, if there is a baseline, exits with an error if any
+stage took more than tolerance times its baseline (plus 50ms, to allow
+for timer noise on the small sizes)."""
+
+import sys,os,random,shutil,tempfile
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+import reflowseq
+try: from time import perf_counter as timer
+except ImportError: from time import time as timer # Python 2
+
+baselineFile = os.path.abspath("edit-reflow-bench.baseline")
+stages = ["parse","apply","write"]
+
+def makeTex(fname,words):
+    f = open(fname,"w")
+    f.write("\\documentclass{article}\n\\begin{document}\n")
+    for w in range(words):
+        if w % 10: f.write("\\wordnumber{%d}{%09d.png}\n" % (w,w))
+        else: f.write("\\resizebox{!}{12pt}{\\includegraphics{%09d.png}}\n" % w) # the other kind of line that line2int has to cope with
+        if w % 500 == 499: f.write("\\textcolor{blue}{\\scalebox{1}[1]{\\raisebox{3pt}[12pt][0pt]{//}}}\n")
+    f.write("\\end{document}\n")
+    f.close()
+
+def abbreviate(first,last):
+    # write last as in "672-83", when it shares a prefix with first
+    a,b = str(first),str(last)
+    for j in range(1,len(b)):
+        if len(a)==len(b) and a[:-j]==b[:-j] and int(b[-j:]) < first: return "%s-%s" % (a,b[-j:])
+    return "%s-%s" % (a,b)
+
+def makeCommands(words,seed=1):
+    r = random.Random(seed) ; c = []
+    for i in range(words//20):
+        first = r.randrange(words) ; last = min(words-1,first+r.randrange(1,30))
+        kind = r.randrange(6)
+        if kind == 0: c += ["delete",abbreviate(first,last)]
+        elif kind == 1: c += ["delete",str(first),str(last)]
+        elif kind == 2: c += ["move",abbreviate(first,last),"to",r.choice(["before","after"]),str(r.randrange(words))]
+        elif kind == 3: c += ["copy"]+[str(w) for w in range(first,last+1)]+["to",r.choice(["before","after"]),str(r.randrange(words))] # ('copy' doesn't take ranges)
+        else: c += ["pause",r.choice(["before","after"]),str(first)]
+    c.append("keep") # keep most of it, in chunks
+    for first in range(0,words,1000): c.append(abbreviate(first,first+899))
+    return c
+
+def bench(words):
+    times = {}
+    makeTex("enlarged.tex",words) ; commands = makeCommands(words)
+    t = timer()
+    doc = reflowseq.EditSequence(reflowseq.readTex())
+    times["parse"] = timer()-t
+    stdout,sys.stdout = sys.stdout,open(os.devnull,"w") # (edits to words that an earlier command deleted will print warnings)
+    t = timer()
+    try: doc.runCommands(commands)
+    finally: sys.stdout = stdout
+    times["apply"] = timer()-t ; t = timer()
+    doc.writeSequenceDat()
+    times["write"] = timer()-t
+    return times
+
+def readBaseline():
+    b = {}
+    try: lines = open(baselineFile).readlines()
+    except IOError: return b
+    for l in lines:
+        words,stage,secs = l.split()
+        b[(int(words),stage)] = float(secs)
+    return b
+
+def main():
+    args = sys.argv[1:] ; save = "--save" in args ; tolerance = 1.5
+    if "--help" in args: print (__doc__) ; return
+    for a in args:
+        if a.startswith("--tolerance="): tolerance = float(a.split("=")[1])
+    sizes = [int(a) for a in args if not a.startswith("--")] or [10000,100000,1000000]
+    baseline = readBaseline() ; results = [] ; failed = False
+    oldDir = os.getcwd() ; tempDir = tempfile.mkdtemp()
+    os.chdir(tempDir)
+    try:
+        for words in sizes:
+            times = bench(words)
+            for stage in stages:
+                t = times[stage] ; results.append((words,stage,t))
+                b = baseline.get((words,stage))
+                if b is None: note = ""
+                elif t > b*tolerance+0.05:
+                    note = "  REGRESSION (baseline %.3f)" % b ; failed = True
+                else: note = "  (baseline %.3f)" % b
+                print ("%8d words %-6s %8.3fs%s" % (words,stage,t,note))
+                sys.stdout.flush()
+    finally:
+        os.chdir(oldDir) ; shutil.rmtree(tempDir)
+    if save:
+        for words,stage,t in results: baseline[(words,stage)] = t
+        f = open(baselineFile,"w")
+        for (words,stage),t in sorted(baseline.items()): f.write("%d %s %.4f\n" % (words,stage,t))
+        f.close()
+        print ("Saved baseline to "+baselineFile)
+    elif failed: sys.exit("Some stages regressed past the baseline")
+
+if __name__=="__main__": main()
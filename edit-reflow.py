@@ -114,21 +114,40 @@ pause after 45 - this will insert 2 blue slashes (//)
 after word number 45.  "before" is also acceptable.
 """)
 
-import sys,os,struct,time
-lines = open("enlarged.tex").readlines()
-try:
-    open("enlarged-orig.tex")
-    print ("WARNING!!!  enlarged-orig.tex already exists.")
-    print ("This probably means you are running edit-reflow.py for a second time.")
+import sys,os,struct,time,zlib
+import reflowseq
+from pools import makePool
+try: from PIL import Image, ImageChops, ImageColor
+except ImportError: Image = None # will fall back to netpbm (slower)
+
+# Each run's commands are appended to a journal, and the
+# resulting sequence is cached in a snapshot, so a later
+# run need only apply its own commands.  The document is
+# rebuilt from enlarged-orig.tex only if the journal has
+# been rewritten (by --rewrite, or by editing it by hand).
+journalFile = "edit-journal.txt" ; snapshotFile = "edit-snapshot.dat"
+rewrite = "--rewrite" in sys.argv[1:]
+if rewrite and os.path.exists(journalFile): os.rename(journalFile,journalFile+".bak")
+if rewrite or not os.path.exists("enlarged-orig.tex"):
+    open(journalFile,"wb").close() # (a new journal, even if it stays empty, so the next run doesn't take this for an older edit-reflow.py's work)
+if not os.path.exists("enlarged-orig.tex"):
+    os.system("cp enlarged.tex enlarged-orig.tex")
+    # (actually enlarged-orig.tex doesn't have to be kept; it can be re-generated by removing enlarged.* and sequence.dat and re-running reflow with a scale parameter and no filenames)
+    baseFile = "enlarged-orig.tex"
+elif rewrite or os.path.exists(journalFile): baseFile = "enlarged-orig.tex"
+else:
+    baseFile = "enlarged.tex"
+    print ("WARNING!!!  enlarged-orig.tex already exists but "+journalFile+" does not.")
+    print ("This probably means an older edit-reflow.py has been run here.")
     print ("Note that your edits WILL BE ADDED to existing edits")
-    print ("(in particular, existing deletions will not be reverted)")
-    print ("unless you move enlarged-orig.tex to enlarged.tex before running this script.")
+    print ("(in particular, existing deletions will not be reverted),")
+    print ("and those existing edits are not in the journal, so they will")
+    print ("be lost if the journal is ever replayed from enlarged-orig.tex.")
+    print ("To start again from enlarged-orig.tex instead, run with --rewrite")
     print ("----------------------------------")
     print ("Pausing for 10 seconds to make above warning more noticeable...")
     time.sleep(10)
-    # (actually enlarged-orig.tex doesn't have to be kept; it can be re-generated by removing enlarged.* and sequence.dat and re-running reflow with a scale parameter and no filenames)
-except IOError:
-    os.system("cp enlarged.tex enlarged-orig.tex")
+open(baseFile).close() # (fail now rather than after commands are typed)
 
 def stripSpaceAroundMinuses(s):
     while True:
@@ -148,83 +167,56 @@ colours = {"yellow":"#ff0",
            "cyan":"#0ff",
            "magenta":"#f0f"}
 
-mode = colourToUse = "start" ; beforeOrAfter = "before"
-keep_deleteList = None
-lines_to_move = []
-copy_mode = 0
-
-def findLines(firstWord,lastWord): return map(lambda i:lines[i], findLineIndices(firstWord,lastWord))
-
-def findLineIndices(firstWord,lastWord):
-    return filter(lambda i:".png}" in lines[i] and line2int(lines[i]) in range(firstWord,lastWord+1),range(len(lines)))
-
-def line2int(line):
-    # need to catch both \wordnumber{..} and \resizebox.. variants, so pick up on the {000000000.png}
-    return int(line[line.find(".png}")-9:line.find(".png}")])
-
-def findIndex(firstWord,lastWord):
-    indexList = findLineIndices(firstWord,lastWord)
-    if not indexList:
-        print ("WARNING: findIndex failed on words %d-%d" % (firstWord,lastWord))
-        return None
-    index = indexList[0]
-    if beforeOrAfter=="after": index += 1
-    return index
-
-def process(firstWord,lastWord):
-    global lines_to_move,keep_deleteList,copy_mode
-    if lastWord<firstWord: lastWord=int(str(firstWord)[:len(str(firstWord))-len(str(lastWord))]+str(lastWord)) # so can say things like 124-8, 572-83, etc
-    if mode=="delete":
-        for l in findLines(firstWord,lastWord): lines.remove(l)
-    elif mode=="keep":
-        if not keep_deleteList: keep_deleteList=filter(lambda x:".png}" in x,lines)
-        for l in findLines(firstWord,lastWord):
-            try:
-                keep_deleteList.remove(l)
-            except ValueError: pass
-    elif mode=="move" or mode=="copy":
-        lines_to_move += findLines(firstWord,lastWord)
-        copy_mode = (mode=="copy")
-    elif mode=="to":
-        if not copy_mode:
-            for l in lines_to_move: lines.remove(l)
-        index = findIndex(firstWord,lastWord)
-        if index:
-            lines_to_move.reverse()
-            for l in lines_to_move: lines.insert(index,l)
-        else: print ("WARNING: could not find where word %d is (in '... to %d'); ignoring that instruction" % (firstWord,firstWord))
-        lines_to_move = []
-    elif mode=="pause":
-        index = findIndex(firstWord,lastWord)
-        if index: lines.insert(index,"\\textcolor{blue}") # will sort out the rest later
-        else: print ("WARNING: could not find where word %d is (in 'pause .. %d'); ignoring that instruction" % (firstWord,firstWord))
-    elif mode=="colour":
-        for w in range(firstWord,lastWord+1): os.system("pngtopnm %09d.png | pnmdepth 16 | ppmchange \"#fff\" \"%s\" | pnmtopng -compression 9 > n && mv n %09d.png" % (w,colourToUse,w))
-
-################################################
-
-for cc in commands:
-    c = cc.lower()
-    if c in colours:
-        mode = "colour"
-        colourToUse = colours[c]
-    elif c in ["delete","keep","move","copy","to","pause"]: mode = c
-    elif c in ["before","after"]: beforeOrAfter = c
-    elif "-" in c:
-        if mode in ["colour","delete","keep","move"]: process(int(c[:c.find("-")]),int(c[c.find("-")+1:]))
-        else: print ("WARNING: '%s' cannot accept a range of values like '%s'; ignoring" % (mode,c))
-    else: process(int(c),int(c))
-
-if keep_deleteList:
-    for l in keep_deleteList: lines.remove(l)
-
-seq=open("sequence.dat","wb")
-for l in lines:
-    if ".png}" in l: i=line2int(l)
-    elif l.startswith("\\textcolor{blue}"): i=-1 # covers pauses that we added and also pauses that were already there (in case we're editing for a second time)
-    else: continue
-    seq.write(struct.pack("i",i))
-seq.close()
+# Recolouring is done in one batch at the end (see recolourAll):
+wordToColour = {} # (first colour given for each word wins, as the old netpbm version left no white for a second colour to change)
+
+# Same result as pngtopnm | pnmdepth 16 | ppmchange "#fff" colour | pnmtopng
+depth16 = [((v*16+127)//255*255+8)//16 for v in range(256)]
+def recolourFile(args):
+    fname,rgb = args
+    try: im = Image.open(fname).convert("RGB").point(depth16*3)
+    except IOError: return "WARNING: could not read "+fname
+    r,g,b = im.split()
+    im.paste(rgb,None,ImageChops.darker(ImageChops.darker(r,g),b).point([0]*255+[255]))
+    im.save("n"+fname,"PNG",compress_level=9) # (per-file temporary, as several are written at once)
+    os.rename("n"+fname,fname)
+
+def recolourAll():
+    if not Image:
+        for w,colour in sorted(wordToColour.items()): os.system("pngtopnm %09d.png | pnmdepth 16 | ppmchange \"#fff\" \"%s\" | pnmtopng -compression 9 > n && mv n %09d.png" % (w,colour,w))
+        return
+    rgb = {} ; jobs = []
+    for w,colour in sorted(wordToColour.items()):
+        if not colour in rgb: rgb[colour] = ImageColor.getrgb(colour)
+        jobs.append(("%09d.png" % w, rgb[colour]))
+    if not jobs: return
+    pool = makePool()
+    for err in pool.imap_unordered(recolourFile,jobs,64):
+        if err: print (err)
+    pool.close() ; pool.join()
+
+def journalKey(journal): return struct.pack("iI",len(journal),zlib.crc32(journal)&0xffffffff)
+
+if rewrite or not os.path.exists(journalFile): journal = b""
+else: journal = open(journalFile,"rb").read()
+try:
+    snapshot = (open(snapshotFile,"rb").read(len(journalKey(b""))) == journalKey(journal))
+except IOError: snapshot = False
+if snapshot and not rewrite: doc = reflowseq.EditSequence(reflowseq.readSequenceDat(snapshotFile,len(journalKey(b""))))
+else:
+    doc = reflowseq.EditSequence(reflowseq.readTex(baseFile))
+    runs = [r.split() for r in journal.decode("latin1").split("\n") if r.strip()]
+    if runs: print ("Replaying %d journalled runs from enlarged-orig.tex" % len(runs))
+    for r in runs: doc.runCommands(r,colours) # (their colours are not redone, as the PNGs were recoloured when the commands were first given)
+
+for w,colour in doc.runCommands(commands,colours).items(): wordToColour.setdefault(w,colour)
+recolourAll()
+if commands:
+    journal += (" ".join(commands)+"\n").encode("latin1")
+    open(journalFile,"ab").write((" ".join(commands)+"\n").encode("latin1"))
+
+doc.writeSequenceDat(snapshotFile,journalKey(journal))
+doc.writeSequenceDat()
 
 print ("""\n\n\n
 All done.  You now need to run reflow.c again, specifying
@@ -233,9 +225,15 @@ the final scale factor, possibly preceded by paper type
 (although you can specify --edit again if you really want to).
 
 Note: If you run edit-reflow again, further edits will be
-ADDED to the edits you've made.  If you don't want this
-(e.g. because the source images contain multiple scans and
-you want to produce completely different documents on
-different occasions), move enlarged-orig.tex to enlarged.tex
-before running edit-reflow.py again.
+ADDED to the edits you've made.  All edits are recorded in
+edit-journal.txt (one line per run).  If you want to undo
+some of them, edit that file and run edit-reflow.py again
+(with no new commands if you like), and the journal will be
+replayed from enlarged-orig.tex.  If you want to start again
+from scratch (e.g. because the source images contain multiple
+scans and you want to produce completely different documents
+on different occasions), run edit-reflow.py --rewrite
+But colours (yellow, red etc) can't be undone in either of
+these ways: they were painted into the word images, which
+stay coloured until reflow.c makes them again from the scans.
 """)
@@ -2,7 +2,7 @@
 # (works in both Python 2 and Python 3)
 
 r"""Calculate LaTeX paper and margin settings for arbitrary magnification
-(C) Silas S. Brown, 2005-2009, 2016, 2019-20, 2025-26.  Version 1.71
+(C) Silas S. Brown, 2005-2009, 2016, 2019-20, 2025-26.  Version 1.75
 
 Licensed under the Apache License, Version 2.0 (the ``License'');
 you may not use this file except in compliance with the License.
@@ -104,6 +104,17 @@ e.g.: `python latex-papersize.py 12 26 myfile.dvi`
 
 which will print the appropriate `dvips` command.
 
+To find where `dvips` should put the origin, it runs `dvips` and
+Ghostscript to measure the bounding box.
+If you set `bbox_sample_pages` to a number, Ghostscript will look at only
+that many pages from the start and about as many more spread over the
+rest, which is quicker on long documents but might miss an outlying page.
+
+If you set `bbox_cache` to a file name (e.g. `~/.latex-papersize-cache`),
+the measurement is remembered in that file, so it is not repeated for the
+same DVI file and settings.  The file gets a line for every DVI file
+measured, so delete it now and then.
+
 # Legacy usage with `pdflatex`
 
 It should no longer be necessary to use the Python script with
@@ -128,6 +139,28 @@ this out causes no room to be left for page numbers and
 `\pagestyle{empty}` to be added.  This does not affect the
 `dvips` command.
 
+# Batch usage
+
+To make the settings for several sizes at once, put one per line in a
+file, each line being base-size desired-size and optionally paper width
+and height, left and top margins (in millimetres) and the points to leave
+for page numbers (or `-` for none), separated by spaces or tabs, e.g.
+
+`12 26`
+
+`12 26 297 210 10 10 15`
+
+Lines beginning with `#` are ignored, and missing paper sizes and
+margins come from the environment variables described below.  Then do
+
+`python latex-papersize.py --batch` file `json`
+
+to print a JSON list with the numbers from each line and its `tex` and
+`pdftex` settings, or `tsv` instead of `json` for one line per setting,
+with the 7 numbers (`-` for no page numbers), the `tex` settings and the
+`pdftex` settings separated by tabs.  If the file is `-` or left out,
+the lines are read from standard input.
+
 # Paper sizes and margins in legacy usage
 
 It is assumed that the final physical printout will be on
@@ -194,6 +227,11 @@ To run `dvips` on the `.dvi` file (not needed for `pdflatex`):
 It is recommended to use the newer `.sty` file with a PDF backend
 instead of doing all this.
 
+Python scripts can also load `latex-papersize.py` as a module (for
+example with `imp.load_source` in Python 2) and call its `geometry`,
+`texSettings` and `dvipsCommand` functions, which saves starting a new
+Python for each setting.
+
 # Where to find history
 You shouldn't need this, but old versions of this utility (along
 with some non-LaTeX utilities for handling scans and reflowing
@@ -208,67 +246,228 @@ at https://ssb22.user.srcf.net/notes/#latex
 """
 
 import os, sys, subprocess
+from array import array
 try: from commands import getoutput # Python 2
 except: from subprocess import getoutput # Python 3
 def hasKey(a,b):
   try: return a.has_key(b) # old Python 2
   except: return b in a # newer Python 2 + Python 3
-if (len(sys.argv)==2 and sys.argv[1]=="--help") or len(sys.argv)==1:
-  print(__doc__.strip()); raise SystemExit
-if len(sys.argv)==2 and sys.argv[1]=="--version":
-  print(__doc__[:__doc__.find("\n\n")].strip()); raise SystemExit
-if len(sys.argv)==2 and sys.argv[1]=="--texhelp":
-  import re; print("% This file is automatically generated by\n% python latex-papersize.py --texhelp\n\\documentclass[12pt]{article}\n\\usepackage[extrabottom=15pt]{latex-papersize}\\setlength{\emergencystretch}{3em}\n\\usepackage{microtype}\n\\usepackage[T1]{fontenc}\n\\usepackage[colorlinks,allcolors=blue]{hyperref}\n\\begin{document}\\title{latex-papersize\\\\\\large "+__doc__.strip().split("\n")[0].replace("LaTeX","\\LaTeX{}")+"}\n\\author{Silas S. Brown}\n\\date{"+__doc__.strip().split("\n")[1].split(",",1)[1].strip().replace("-","--").replace("Version ","Version~")+"}\n\\maketitle\n"+re.sub('([_$&#%])',r'\\\1',re.sub(r"(?<![a-z])_([^_]*)_(?![a-z])",r"{\\em \1}",re.sub(r"(?<!`)`([^`]+)`",r"\\texttt{\1}",re.sub("\n# (.*)\n",r"\\section*{\1}",re.sub("(https*://[A-Za-z0-9./#-]*)",r"\\url{\1}",__doc__.split("\n\n",1)[1].replace(' $(','`\n\n`$(').replace("\\",r"\textbackslash ").replace('{',r'\{').replace('}',r'\}').replace('|',r'\textbar{}').replace('LaTeX',r'\LaTeX{}').replace(' TeX',' \TeX{}').replace("^",r"\textasciicircum{}").replace("~",r"\textasciitilde{}"))))).replace("...",r"\ldots{}"))+r"\end{document}") ; raise SystemExit
-
-base_pointsize = float(sys.argv[1])
-desired_pointsize = float(sys.argv[2])
-
-if len(sys.argv)>4:
-  extra_bottom_margin_mm = float(sys.argv[4])*25.4/72
-  pageStyle = ""
-else:
-  extra_bottom_margin_mm = 0
-  pageStyle = " \\pagestyle{empty}"
-
-if hasKey(os.environ,"paper_width"): paper_width=float(os.environ["paper_width"])
-else: paper_width=210
-if hasKey(os.environ,"paper_height"): paper_height=float(os.environ["paper_height"])
-else: paper_height=297
-if hasKey(os.environ,"margin_left"): margin_left=float(os.environ["margin_left"])
-else: margin_left=10
-if hasKey(os.environ,"margin_top"): margin_top=float(os.environ["margin_top"])
-else: margin_top=10
-
-paper_magstep = 1.0*desired_pointsize/base_pointsize
-paperwidth = paper_width/paper_magstep
-textwidth = (paper_width-2*margin_left)/paper_magstep
-paperheight = paper_height/paper_magstep
-textheight = (paper_height-2*margin_top)/paper_magstep-extra_bottom_margin_mm # note extra_bottom_margin_mm is NOT divided by paper_magstep because it corresponds to the height of the textual page-number, which will be magnified
-margin_left_setting = margin_left/paper_magstep
-margin_top_setting = margin_top/paper_magstep
-
-if sys.argv[3]=="tex" or sys.argv[3]=="pdftex":
-  s="\\textwidth=%.1fmm \\textheight=%.1fmm \\topmargin=%.1fmm \\marginparwidth=0mm \\oddsidemargin=%.1fmm \\evensidemargin=%.1fmm \\columnsep=%.1fmm%s" % (textwidth,textheight,margin_top_setting,margin_left_setting,margin_left_setting,margin_left_setting,pageStyle)
-  if sys.argv[3]=="pdftex":
-    s += "\\mag=%d \\pdfpagewidth=%d true mm \\pdfpageheight=%d true mm \\pdfhorigin=0 mm \\pdfvorigin=-12.95 mm \\paperwidth=%d true mm \\paperheight=%d true mm" % (1000*paper_magstep,paper_width,paper_height,paper_width,paper_height) # the -12.95mm seems to be a constant regardless of magnification (previous version had -14 but it sems -12.95 is more accurate - at least 12.9 is too small and 13 is too big).  Need \paperwidth and \paperheight in there as well in case using hyperref.
-  print(s)
-else:
-  r = subprocess.call(["dvips","-T","%dmm,%dmm"%(paper_width*10,paper_height*10),"-x","%d"%(1000*paper_magstep+0.5),sys.argv[3],"-o","bbox_test.ps"])
+
+geometryCache = {}
+def geometry(base_pointsize,desired_pointsize,paper_width=210,paper_height=297,margin_left=10,margin_top=10,extra_bottom_points=None):
+  """Settings for magnifying base_pointsize to desired_pointsize on
+  paper of this size and margins (in mm), as a dict.  extra_bottom_points
+  is how much room to leave for page numbers (None for none, and
+  \\pagestyle{empty}).  Results are remembered, so calling it again
+  with the same parameters is quick."""
+  key = (base_pointsize,desired_pointsize,paper_width,paper_height,margin_left,margin_top,extra_bottom_points)
+  if not hasKey(geometryCache,key):
+    if extra_bottom_points is None:
+      extra_bottom_margin_mm = 0
+      pageStyle = " \\pagestyle{empty}"
+    else:
+      extra_bottom_margin_mm = float(extra_bottom_points)*25.4/72
+      pageStyle = ""
+    paper_magstep = 1.0*desired_pointsize/base_pointsize
+    geometryCache[key] = {
+      "paper_magstep":paper_magstep,
+      "paper_width":paper_width, "paper_height":paper_height,
+      "margin_left":margin_left, "margin_top":margin_top,
+      "paperwidth":paper_width/paper_magstep,
+      "textwidth":(paper_width-2*margin_left)/paper_magstep,
+      "paperheight":paper_height/paper_magstep,
+      "textheight":(paper_height-2*margin_top)/paper_magstep-extra_bottom_margin_mm, # note extra_bottom_margin_mm is NOT divided by paper_magstep because it corresponds to the height of the textual page-number, which will be magnified
+      "margin_left_setting":margin_left/paper_magstep,
+      "margin_top_setting":margin_top/paper_magstep,
+      "pageStyle":pageStyle}
+  return geometryCache[key].copy()
+
+def texSettings(g,pdftex=False):
+  "What to put after \\documentclass (or before \\begin{document} if pdftex) for geometry g"
+  s="\\textwidth=%.1fmm \\textheight=%.1fmm \\topmargin=%.1fmm \\marginparwidth=0mm \\oddsidemargin=%.1fmm \\evensidemargin=%.1fmm \\columnsep=%.1fmm%s" % (g["textwidth"],g["textheight"],g["margin_top_setting"],g["margin_left_setting"],g["margin_left_setting"],g["margin_left_setting"],g["pageStyle"])
+  if pdftex:
+    s += "\\mag=%d \\pdfpagewidth=%d true mm \\pdfpageheight=%d true mm \\pdfhorigin=0 mm \\pdfvorigin=-12.95 mm \\paperwidth=%d true mm \\paperheight=%d true mm" % (1000*g["paper_magstep"],g["paper_width"],g["paper_height"],g["paper_width"],g["paper_height"]) # the -12.95mm seems to be a constant regardless of magnification (previous version had -14 but it sems -12.95 is more accurate - at least 12.9 is too small and 13 is too big).  Need \paperwidth and \paperheight in there as well in case using hyperref.
+  return s
+
+def dviNum(d,i,n,signed=0):
+  "n-byte integer at d[i] (MSB first, as in DVI files)"
+  v = 0
+  for k in range(n): v = v*256 + d[i+k]
+  if signed and v >= 1<<(8*n-1): v -= 1<<(8*n)
+  return v
+
+def dviPages(dviFile):
+  "\\count0 of each page of dviFile, in order (found from the postamble and bop pointers, without reading the pages)"
+  d = array('B',open(dviFile,"rb").read())
+  i = len(d)-1
+  while d[i]==223: i -= 1 # (padding after post_post's id byte)
+  post = dviNum(d,i-4,4)
+  bop = dviNum(d,post+1,4,1) ; r = []
+  while bop >= 0:
+    r.append(dviNum(d,bop+1,4,1))
+    bop = dviNum(d,bop+41,4,1)
+  r.reverse() ; return r
+
+def samplePages(dviFile,n):
+  """\\count0 values (for dvips -pp) of the first n pages of dviFile
+  and about n more spread over the rest (None if that's all of them)"""
+  count0 = dviPages(dviFile)
+  if len(count0) <= 2*n: return None
+  pages = list(range(n)) + list(range(n,len(count0),(len(count0)-n)//n))
+  pages = dict([(count0[p],1) for p in pages if count0[p] >= 0]) # (dvips -pp can't take negative \count0, e.g. roman-numbered pages)
+  if not pages: return None
+  pages = list(pages.keys()) ; pages.sort() ; return pages
+
+def gsOrigin(g,dviFile,pages=None):
+  "Where the top left of what's on dviFile's pages will be, in mm from the top left of the paper, found by running dvips and gs (on only these \\count0 pages if given)"
+  paper_width,paper_height,paper_magstep = g["paper_width"],g["paper_height"],g["paper_magstep"]
+  bboxFile = os.path.join(os.path.dirname(dviFile),"bbox_test.ps") # (next to the DVI, so several can run at once in different directories)
+  if pages: pageList = ["-pp",",".join([str(p) for p in pages])]
+  else: pageList = []
+  r = subprocess.call(["dvips","-T","%dmm,%dmm"%(paper_width*10,paper_height*10),"-x","%d"%(1000*paper_magstep+0.5)]+pageList+[dviFile,"-o",bboxFile])
   assert not r, "dvips failed"
   # Now, that would have got the origin wrong.  I can't
   # figure out how dvips origin and magstep is supposed to
   # interoperate, so let's work it out on a case-by-case
   # basis from the bounding box.
   # (Note: multiplying paper_width and paper_height by 10 above, because if dealing with very small paper sizes then this may give a reading of 0 if the origin is off the page.  Increasing the paper size doesn't seem to affect the origin.)
-  bbox=getoutput("echo|gs -sDEVICE=bbox bbox_test.ps 2>&1|grep BoundingBox")
+  bbox=getoutput("echo|gs -sDEVICE=bbox \""+bboxFile+"\" 2>&1|grep BoundingBox")
   # (previous version used 'head -1' to take only the first page, but that can cause 'broken pipe' errors if the file contains too many pages, and will give an incorrect result if there is only one line per page and it is indented on the first page, so we'll look at ALL the pages and take the outermost bounds.  Will also look at high-resolution bounding boxes only, if available.)
-  if "HiResBoundingBox" in bbox: bbox=filter(lambda x:"HiRes" in x,bbox.split("\n"))
+  if "HiResBoundingBox" in bbox: bbox=[x for x in bbox.split("\n") if "HiRes" in x]
   else: bbox=bbox.split("\n")
-  bbox = map(lambda x:tuple(map(lambda y:float(y),x.split(" ")[1:])), bbox)
-  bbox = filter(lambda x: not x==(0,0,0,0), bbox)
+  bbox = [tuple([float(y) for y in x.split(" ")[1:]]) for x in bbox]
+  bbox = [x for x in bbox if not x==(0,0,0,0)]
   assert bbox, "Could not get a sensible bounding box from bbox_test.ps.  (If you're on Ubuntu, beware of bug #160203 in Ubuntu's ghostscript package.)"
-  os.unlink("bbox_test.ps")
-  existing_left_margin_mm = min(map(lambda x:x[0],bbox))*25.4/72
-  existing_top_margin_mm = paper_height*10-max(map(lambda x:x[3],bbox))*25.4/72
-  print("dvips -T %dmm,%dmm -O %.1fmm,%.1fmm -x %d %s" % (paper_width,paper_height,margin_left - existing_left_margin_mm,margin_top - existing_top_margin_mm,1000*paper_magstep+0.5,sys.argv[3]))
+  os.unlink(bboxFile)
+  existing_left_margin_mm = min([x[0] for x in bbox])*25.4/72
+  existing_top_margin_mm = paper_height*10-max([x[3] for x in bbox])*25.4/72
+  return existing_left_margin_mm,existing_top_margin_mm
+
+# Origins already measured, by cache file, then by DVI hash, magnification,
+# paper size and method, so the same DVI needn't be measured again
+originCaches = {}
+def originCache(cacheFile):
+  cacheFile = os.path.expanduser(cacheFile)
+  if not hasKey(originCaches,cacheFile):
+    c = originCaches[cacheFile] = {}
+    try: lines = open(cacheFile).readlines()
+    except IOError: lines = []
+    for line in lines:
+      fields = line.split()
+      if len(fields)==7: c[" ".join(fields[:5])] = (float(fields[5]),float(fields[6]))
+  return originCaches[cacheFile]
+
+def dviHash(dviFile):
+  try: from hashlib import sha1
+  except ImportError: from sha import new as sha1 # Python 2.4
+  return sha1(open(dviFile,"rb").read()).hexdigest()
+
+def findOrigin(g,dviFile,sample=0,cacheFile=None):
+  """Where the top left of what's on dviFile's pages will be when dvips
+  magnifies it for geometry g, in mm from the top left of the paper (runs
+  dvips and gs to find it; if sample, gs looks at only the first sample
+  pages and about as many more).  If cacheFile, origins are kept in it and
+  not measured again for the same DVI and settings."""
+  origin = key = None
+  if cacheFile:
+    key = "%s %d %g %g %s" % (dviHash(dviFile),int(1000*g["paper_magstep"]+0.5),g["paper_width"],g["paper_height"],"gs"+str(sample))
+    origin = originCache(cacheFile).get(key)
+  if origin is None:
+    pages = None
+    if sample:
+      try: pages = samplePages(dviFile,sample)
+      except IndexError: pass # (no postamble?  do all pages)
+    origin = gsOrigin(g,dviFile,pages)
+  if key and not hasKey(originCache(cacheFile),key):
+    originCache(cacheFile)[key] = origin
+    try: open(os.path.expanduser(cacheFile),"a").write("%s %r %r\n" % ((key,)+tuple(origin)))
+    except IOError: pass # (read-only home directory?  never mind)
+  return origin
+
+def dvipsCommand(g,dviFile,sample=0,cacheFile=None,origin=None):
+  """The dvips command for dviFile with geometry g, putting the origin
+  where findOrigin says (or where origin says, if given, e.g. to line up
+  with what another DVI file was measured as)"""
+  if origin is None: origin = findOrigin(g,dviFile,sample,cacheFile)
+  existing_left_margin_mm,existing_top_margin_mm = origin
+  return "dvips -T %dmm,%dmm -O %.1fmm,%.1fmm -x %d %s" % (g["paper_width"],g["paper_height"],g["margin_left"] - existing_left_margin_mm,g["margin_top"] - existing_top_margin_mm,1000*g["paper_magstep"]+0.5,dviFile)
+
+batchColumns = ["base_pointsize","desired_pointsize","paper_width","paper_height","margin_left","margin_top","extra_bottom_points"]
+
+def batchSettings(lines,paper_width=210,paper_height=297,margin_left=10,margin_top=10):
+  """tex and pdftex settings for each row of lines (whitespace-separated
+  columns as in batchColumns, after the first two optional, extra bottom
+  points - for none; blank lines and # comments ignored), as a list of
+  dicts with those columns and "tex" and "pdftex" """
+  out = []
+  for lineNo,line in enumerate(lines):
+    f = line.split("#",1)[0].split()
+    if not f: continue
+    if len(f) not in [2,4,6,7]: raise ValueError("line %d: expected 2, 4, 6 or 7 columns, got %d" % (lineNo+1,len(f)))
+    row = dict(zip(batchColumns,[2,2,paper_width,paper_height,margin_left,margin_top,None]))
+    for k,v in zip(batchColumns,f):
+      if v=="-" and k=="extra_bottom_points": continue
+      try: row[k] = float(v)
+      except ValueError: raise ValueError("line %d: %s is not a number: %s" % (lineNo+1,k,v))
+    for k in batchColumns:
+      v = row[k]
+      if v is None: continue
+      if not -1e9 < v < 1e9: raise ValueError("line %d: %s is out of range: %g" % (lineNo+1,k,v)) # (also catches inf and nan)
+      if v <= 0 and k in batchColumns[:4]: raise ValueError("line %d: %s must be more than 0: %g" % (lineNo+1,k,v))
+    if not 0.5 <= 1000.0*row["desired_pointsize"]/row["base_pointsize"] < 32768.5: raise ValueError("line %d: magnification %g/%g is out of TeX's range" % (lineNo+1,row["desired_pointsize"],row["base_pointsize"]))
+    try:
+      g = geometry(*[row[k] for k in batchColumns])
+      row["tex"],row["pdftex"] = texSettings(g),texSettings(g,True)
+    except (ZeroDivisionError,OverflowError,ValueError): raise ValueError("line %d: can't make settings for these sizes" % (lineNo+1,))
+    out.append(row)
+  return out
+
+def batchOutput(rows,fmt="json"):
+  "batchSettings rows as JSON, or as TSV (batchColumns then tex and pdftex, no header)"
+  if fmt=="json":
+    import json ; return json.dumps(rows,indent=1,sort_keys=True)
+  def fmtCol(v):
+    if v is None: return "-"
+    if isinstance(v,str): return v
+    return "%g" % v
+  return "\n".join(["\t".join([fmtCol(r[k]) for k in batchColumns+["tex","pdftex"]]) for r in rows])
+
+def main():
+  if len(sys.argv)>1 and sys.argv[1]=="--batch":
+    fmt,fname = "json","-"
+    for a in sys.argv[2:]:
+      if a in ["json","tsv"]: fmt = a
+      else: fname = a
+    paper = {"paper_width":210, "paper_height":297, "margin_left":10, "margin_top":10}
+    for k in list(paper.keys()):
+      if hasKey(os.environ,k): paper[k]=float(os.environ[k])
+    if fname=="-": lines = sys.stdin.readlines()
+    else:
+      try: lines = open(fname).readlines()
+      except IOError: raise SystemExit("latex-papersize: can't read "+fname+": "+str(sys.exc_info()[1].strerror))
+    try: rows = batchSettings(lines,**paper)
+    except ValueError: raise SystemExit("latex-papersize: "+str(sys.exc_info()[1]))
+    if rows: print(batchOutput(rows,fmt))
+    raise SystemExit
+  if (len(sys.argv)==2 and sys.argv[1]=="--help") or len(sys.argv)==1:
+    print(__doc__.strip()); raise SystemExit
+  if len(sys.argv)==2 and sys.argv[1]=="--version":
+    print(__doc__[:__doc__.find("\n\n")].strip()); raise SystemExit
+  if len(sys.argv)==2 and sys.argv[1]=="--texhelp":
+    import re; print("% This file is automatically generated by\n% python latex-papersize.py --texhelp\n\\documentclass[12pt]{article}\n\\usepackage[extrabottom=15pt]{latex-papersize}\\setlength{\emergencystretch}{3em}\n\\usepackage{microtype}\n\\usepackage[T1]{fontenc}\n\\usepackage[colorlinks,allcolors=blue]{hyperref}\n\\begin{document}\\title{latex-papersize\\\\\\large "+__doc__.strip().split("\n")[0].replace("LaTeX","\\LaTeX{}")+"}\n\\author{Silas S. Brown}\n\\date{"+__doc__.strip().split("\n")[1].split(",",1)[1].strip().replace("-","--").replace("Version ","Version~")+"}\n\\maketitle\n"+re.sub('([_$&#%])',r'\\\1',re.sub(r"(?<![a-z])_([^_]*)_(?![a-z])",r"{\\em \1}",re.sub(r"(?<!`)`([^`]+)`",r"\\texttt{\1}",re.sub("\n# (.*)\n",r"\\section*{\1}",re.sub("(https*://[A-Za-z0-9./#-]*)",r"\\url{\1}",__doc__.split("\n\n",1)[1].replace(' $(','`\n\n`$(').replace("\\",r"\textbackslash ").replace('{',r'\{').replace('}',r'\}').replace('|',r'\textbar{}').replace('LaTeX',r'\LaTeX{}').replace(' TeX',' \TeX{}').replace("^",r"\textasciicircum{}").replace("~",r"\textasciitilde{}"))))).replace("...",r"\ldots{}"))+r"\end{document}") ; raise SystemExit
+
+  base_pointsize = float(sys.argv[1])
+  desired_pointsize = float(sys.argv[2])
+  if len(sys.argv)>4: extra_bottom_points = float(sys.argv[4])
+  else: extra_bottom_points = None
+  paper = {"paper_width":210, "paper_height":297, "margin_left":10, "margin_top":10}
+  for k in list(paper.keys()):
+    if hasKey(os.environ,k): paper[k]=float(os.environ[k])
+  g = geometry(base_pointsize,desired_pointsize,paper["paper_width"],paper["paper_height"],paper["margin_left"],paper["margin_top"],extra_bottom_points)
+  if sys.argv[3]=="tex" or sys.argv[3]=="pdftex":
+    print(texSettings(g,sys.argv[3]=="pdftex"))
+  else:
+    print(dvipsCommand(g,sys.argv[3],int(os.environ.get("bbox_sample_pages","0")),os.environ.get("bbox_cache")))
+
+if __name__=="__main__": main()
 # ruff:noqa: E401,E701,E702,E722
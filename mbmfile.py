@@ -0,0 +1,140 @@
+# Write EPOC multi-bitmap (.mbm) files without Bmconv.exe
+# (c) Silas S. Brown 2026.
+
+# (should work in either Python 2 or Python 3)
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+# File layout (all numbers 32-bit LSB-first):
+#   UIDs 10000037 10000042 00000000, checksum 47396439
+#   offset of the trailer
+#   the bitmaps, each being a 40-byte header: total size,
+#     header size (40), width, height, width and height
+#     in twips (1440 to the inch, from the resolution of
+#     the BMP Bmconv was given), bits per pixel, 1 if
+#     colour (0 if grey), palette entries (0),
+#     compression (0 = none, 1 = byte RLE);
+#     then the rows, each padded to a multiple of 4 bytes,
+#     with the first pixel in the low bits of each byte
+#   the trailer: number of bitmaps, then their offsets
+# The format has no limit on the number of bitmaps per file
+# (the 510 limit is Bmconv's, and MbmShow also assumes it).
+
+import struct
+try: import numpy
+except ImportError: numpy = None
+
+# flag as given to Bmconv -> (bits per pixel, colour)
+flags = {"/1":(1,0), "/2":(2,0), "/4":(4,0), "/c4":(4,1)}
+
+# the EPOC 16-colour palette, in index order
+epocColour16 = [(0,0,0),(0x55,0x55,0x55),(0x80,0,0),(0x80,0x80,0),(0,0x80,0),(0xff,0,0),(0xff,0xff,0),(0,0xff,0),(0xff,0,0xff),(0,0,0xff),(0,0xff,0xff),(0x80,0,0x80),(0,0,0x80),(0,0x80,0x80),(0xaa,0xaa,0xaa),(0xff,0xff,0xff)]
+
+bmpPelsPerMetre = 3780 # the resolution of the BMP files that tex2mbm gives
+# Bmconv (Pillow's default of 96 dpi), which Bmconv turns into twips
+
+def twips(pixels):
+    "Pixels at bmpPelsPerMetre as twips, to the nearest twip"
+    return (pixels*14400000+bmpPelsPerMetre*127)//(bmpPelsPerMetre*254)
+
+def readPPM(ppmData):
+    "Width, height and RGB bytes of a P6 PPM with maxval 255"
+    magic,w,h,rest = ppmData.split(None,3) # (rest = maxval, 1 whitespace byte, pixels)
+    return int(w),int(h),bytearray(rest[len(rest.split(None,1)[0])+1:])
+
+def nearestColour(rgb):
+    dist = [sum([(a-b)*(a-b) for a,b in zip(rgb,c)]) for c in epocColour16]
+    return dist.index(min(dist))
+
+def pixelValues(w,h,pixels,bpp,colour):
+    "One byte per pixel: grey level (0 = black) or EPOC colour index"
+    r,g,b = pixels[0::3],pixels[1::3],pixels[2::3]
+    if colour:
+        cache = {} ; v = bytearray(w*h)
+        for i,rgb in enumerate(zip(r,g,b)):
+            if not rgb in cache: cache[rgb] = nearestColour(rgb)
+            v[i] = cache[rgb]
+        return v
+    if not r==g==b: r = bytearray([(299*R+587*G+114*B+500)//1000 for R,G,B in zip(r,g,b)]) # luminance
+    maxLevel = (1<<bpp)-1
+    return bytearray(bytes(r).translate(bytes(bytearray([(v*maxLevel+127)//255 for v in range(256)]))))
+
+def pack(w,h,values,bpp):
+    "Rows of pixel values packed at bpp bits, padded to 4 bytes"
+    perByte = 8//bpp ; rowBytes = (w*bpp+31)//32*4
+    if numpy:
+        v = numpy.zeros((h,rowBytes*perByte),numpy.uint16)
+        v[:,:w] = numpy.frombuffer(bytes(values),numpy.uint8).reshape(h,w)
+        v <<= numpy.tile(numpy.arange(perByte,dtype=numpy.uint16)*bpp,rowBytes)
+        return v.reshape(h,rowBytes,perByte).sum(axis=2).astype(numpy.uint8).tobytes()
+    out = bytearray() ; padding = bytearray(rowBytes*perByte-w)
+    for y in range(h):
+        row = values[y*w:(y+1)*w] + padding
+        out += bytearray([sum([row[i+k] << (k*bpp) for k in range(perByte)]) for i in range(0,len(row),perByte)])
+    return bytes(out)
+
+def byteRLE(data):
+    "EPOC byte run-length encoding: n<128 = next byte n+1 times, n>=128 = next 256-n bytes as they are"
+    data = bytearray(data) ; out = bytearray() ; i = 0 ; literal = bytearray()
+    while i < len(data):
+        run = 1
+        while run < 128 and i+run < len(data) and data[i+run]==data[i]: run += 1
+        if run > 2 or len(literal)==128:
+            if literal:
+                out.append(256-len(literal)) ; out += literal ; literal = bytearray()
+            if run > 2:
+                out.append(run-1) ; out.append(data[i]) ; i += run ; continue
+        literal.append(data[i]) ; i += 1
+    if literal: out.append(256-len(literal)) ; out += literal
+    return bytes(out)
+
+def mbmBitmap(args):
+    "Bitmap record (header and data) for PPM data with a Bmconv-style flag"
+    ppmData,flag,compress = args
+    bpp,colour = flags[flag]
+    w,h,pixels = readPPM(ppmData)
+    data = pack(w,h,pixelValues(w,h,pixels,bpp,colour),bpp)
+    if compress: data = byteRLE(data)
+    return struct.pack("<10I",40+len(data),40,w,h,twips(w),twips(h),bpp,colour,0,compress and 1 or 0)+data
+
+def writeMBM(fname,bitmaps):
+    "Write a .mbm file from a list of bitmap records"
+    o = open(fname,"wb")
+    o.write(struct.pack("<5I",0x10000037,0x10000042,0,0x47396439,0)) # (trailer offset filled in below)
+    offsets = []
+    for b in bitmaps:
+        offsets.append(o.tell()) ; o.write(b)
+    trailer = o.tell()
+    o.write(struct.pack("<%dI" % (len(offsets)+1),len(offsets),*offsets))
+    o.seek(16) ; o.write(struct.pack("<I",trailer)) ; o.close()
+
+def mbmName(baseFilename,fileNo):
+    "Name of .mbm file fileNo as MbmShow looks for it (font.mbm, font1.mbm, ... fontA.mbm etc)"
+    if fileNo: return baseFilename+("%X" % fileNo)+".mbm"
+    return baseFilename+".mbm"
+
+def bitmapRanges(mbmData):
+    "(start,end) of each bitmap record in .mbm file data (as written by writeMBM or Bmconv)"
+    trailer = struct.unpack("<I",mbmData[16:20])[0]
+    count = struct.unpack("<I",mbmData[trailer:trailer+4])[0]
+    r = []
+    for start in struct.unpack("<%dI" % count,mbmData[trailer+4:trailer+4+4*count]):
+        r.append((start,start+struct.unpack("<I",mbmData[start:start+4])[0]))
+    return r
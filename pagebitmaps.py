@@ -0,0 +1,170 @@
+# Crop and convert the pages that gs renders for
+# tex2mbm.py and tex2mbm-fast.py, using Pillow if it's
+# there (one decode per page, no extra processes), or
+# netpbm if not
+# (c) Silas S. Brown 2007-2009, 2026.
+
+# (should work in either Python 2 or Python 3)
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+import os, sys, subprocess
+from io import BytesIO
+from datfiles import parseXBM
+from pools import makePool # (here too for the scripts that import it from here)
+from mbmfile import mbmBitmap
+try: from PIL import Image, ImageChops
+except ImportError: Image = None # will fall back to netpbm (slower)
+try: import numpy
+except ImportError: numpy = None
+try: from hashlib import blake2b as digester
+except ImportError: from hashlib import md5 as digester # Python 2
+
+# the 16 colours used by Sketch on S7 - probably safest to keep to those
+epoc16 = [(0,0,0),(0,0xff,0xff),(0,0xff,0),(0x55,0x55,0x55),(0x88,0,0),(0,0,0x88),(0xaa,0xaa,0xaa),(0xff,0,0xff),(0xff,0,0),(0x99,0x99,0),(0,0x99,0x99),(0x99,0,0x99),(0xff,0xff,0xff),(0xff,0xff,0),(0,0x88,0),(0,0,0xff)]
+epoc2 = [(0,0,0),(0xff,0xff,0xff)] # black & white
+epoc4 = [(0,0,0),(0x55,0x55,0x55),(0xaa,0xaa,0xaa),(0xff,0xff,0xff)] # 4 greys
+
+def ppm(rgbList):
+    "A 1-pixel-high PPM of these colours (for pnmremap -mapfile)"
+    return ("P6\n%d 1\n255\n" % len(rgbList)).encode("latin1") + bytes(bytearray([v for rgb in rgbList for v in rgb]))
+
+def cropPage(fname):
+    "Same as pngtopnm | pnmcrop -white -left -right -bottom (don't crop top because we're using it for alignment), or None if all white"
+    im = Image.open(fname).convert("RGB")
+    box = ImageChops.difference(im,Image.new("RGB",im.size,(255,255,255))).getbbox()
+    if not box: return None
+    return im.crop((box[0],0,box[2],box[3]))
+
+def ppmBytes(im): return ("P6\n%d %d\n255\n" % im.size).encode("latin1") + im.tobytes()
+
+reverseBits = bytes(bytearray([int(("%8s" % bin(i)[2:]).replace(" ","0")[::-1],2) for i in range(256)]))
+def xbmRows(im):
+    "Width, height and packed rows of ppmtopgm | pgmtopbm -threshold | pbmtoxbm"
+    bits = im.convert("L").point([255]*128+[0]*128,"1") # 1 = black, as in XBM
+    return im.size[0],im.size[1],bits.tobytes().translate(reverseBits) # (XBM has the leftmost pixel in the low bit)
+
+def xbmGlyph(pngFile):
+    "xbmRows of a (cropped) PNG file, for datfiles.ImagesDatWriter"
+    if Image: return xbmRows(Image.open(pngFile))
+    return parseXBM(os.popen('pngtopnm "'+pngFile+'" | ppmtopgm | pgmtopbm -threshold | pbmtoxbm').read())
+
+def xbmGlyphFromPPM(ppmData):
+    "xbmRows of PPM data"
+    if Image: return xbmRows(Image.open(BytesIO(ppmData)))
+    p = subprocess.Popen("ppmtopgm | pgmtopbm -threshold | pbmtoxbm",shell=True,stdin=subprocess.PIPE,stdout=subprocess.PIPE)
+    return parseXBM(p.communicate(ppmData)[0])
+
+def convertPage(args):
+    """Crop page pngFile and write prefix.bmp and/or prefix.png
+    as asked; returns False if page blank"""
+    pngFile,prefix,wantBMP,wantPNG = args
+    if not Image:
+        dat = os.popen('pngtopnm "'+pngFile+'" | pnmcrop -white -left -right -bottom').read()
+        if not dat: return False # maybe it was a blank page (pnmcrop error)
+        if wantPNG: os.popen("pnmtopng -compression 9 > \""+prefix+".png\"","w").write(dat)
+        if wantBMP: os.popen("ppmtobmp > \""+prefix+".bmp\"","w").write(dat)
+        return True
+    im = cropPage(pngFile)
+    if not im: return False
+    if wantPNG: im.save(prefix+".png","PNG",compress_level=9)
+    if wantBMP: im.save(prefix+".bmp","BMP")
+    return True
+
+def cropPageTo(args):
+    "Crop page pngFile and save it to PNG file dest; returns False if page blank"
+    pngFile,dest = args
+    if not Image:
+        dat = os.popen('pngtopnm "'+pngFile+'" | pnmcrop -white -left -right -bottom').read()
+        if not dat: return False
+        os.popen("pnmtopng > \""+dest+"\"","w").write(dat)
+        return True
+    im = cropPage(pngFile)
+    if not im: return False
+    im.save(dest,"PNG")
+    return True
+
+def glyphDigest(pngFile):
+    "A digest of the pixels in pngFile, for finding identical glyphs"
+    if not Image: return digester(os.popen('pngtopnm "'+pngFile+'"').read()).digest()
+    im = Image.open(pngFile).convert("RGB")
+    return digester(("%d %d " % im.size).encode("latin1")+im.tobytes()).digest()
+
+def mbmBitmapFromPNG(args):
+    "mbmfile.mbmBitmap for a PNG file"
+    pngFile,flag,compress = args
+    if Image: dat = ppmBytes(Image.open(pngFile).convert("RGB"))
+    else: dat = os.popen('pngtopnm "'+pngFile+'"').read()
+    return mbmBitmap((dat,flag,compress))
+
+def nearestColour(rgb,palette=epoc16):
+    "The colour in palette nearest to rgb (the first, if several are equally near), as pnmremap -nofs picks it"
+    dist = [sum([(a-b)*(a-b) for a,b in zip(rgb,c)]) for c in palette]
+    return palette[dist.index(min(dist))]
+
+def remapPixels(pixels):
+    "RGB bytes with each pixel mapped to its nearestColour in epoc16"
+    if numpy:
+        p = numpy.frombuffer(pixels,numpy.uint8).reshape(-1,3).astype(numpy.int32)
+        colours,inverse = numpy.unique((p[:,0]<<16)|(p[:,1]<<8)|p[:,2],return_inverse=True) # (each colour measured once)
+        colours = numpy.stack([colours>>16,(colours>>8)&0xff,colours&0xff],axis=1)
+        palette = numpy.array(epoc16,numpy.int32)
+        nearest = ((colours[:,None,:]-palette[None,:,:])**2).sum(axis=2).argmin(axis=1) # (argmin takes the first of equals)
+        return palette.astype(numpy.uint8)[nearest][inverse.reshape(-1)].tobytes()
+    pixels = bytearray(pixels) ; out = bytearray(len(pixels)) ; cache = {}
+    for i in range(0,len(pixels),3):
+        rgb = (pixels[i],pixels[i+1],pixels[i+2])
+        if not rgb in cache: cache[rgb] = bytearray(nearestColour(rgb))
+        out[i:i+3] = cache[rgb]
+    return bytes(out)
+
+def remapPage(args):
+    """Crop page pngFile and map it to the EPOC 16 colours without
+    dithering, returning PPM data (empty if page blank)"""
+    pngFile,mapFile = args
+    if not Image: return os.popen('pngtopnm "'+pngFile+'" | pnmcrop -white -left -right -bottom | pnmremap -nofs -mapfile="'+mapFile+'" 2>/dev/null').read()
+    im = cropPage(pngFile)
+    if not im: return "".encode("latin1")
+    return ("P6\n%d %d\n255\n" % im.size).encode("latin1") + remapPixels(im.tobytes())
+
+def writeBMP(ppmData,fname):
+    "Same as ppmtobmp > fname"
+    if Image: Image.open(BytesIO(ppmData)).save(fname,"BMP")
+    else: os.popen("ppmtobmp > "+fname,"w").write(ppmData)
+
+def ppmColours(ppmData):
+    "The set of (r,g,b) colours in a P6 PPM with maxval 255"
+    rest = ppmData.split(None,3)[3] # (maxval, 1 whitespace byte, pixels)
+    pixels = rest[len(rest.split(None,1)[0])+1:]
+    if numpy:
+        p = numpy.frombuffer(pixels,numpy.uint8).reshape(-1,3).astype(numpy.uint32)
+        return set([(int(c)>>16,(int(c)>>8)&0xff,int(c)&0xff) for c in numpy.unique((p[:,0]<<16)|(p[:,1]<<8)|p[:,2])])
+    pixels = bytearray(pixels)
+    return set(zip(pixels[0::3],pixels[1::3],pixels[2::3]))
+
+def bmconvFlag(ppmData):
+    """The bmconv colour-depth flag for PPM data that's already
+    been mapped to the EPOC 16 colours (remapping it to the
+    4 greys or to black & white, and back, would leave it
+    unchanged only if it had no other colours anyway)"""
+    colours = ppmColours(ppmData)
+    if colours <= set(epoc2): return "/1" # B&W
+    elif colours <= set(epoc4): return "/2" # grey
+    else: return "/c4" # 16 colours
@@ -0,0 +1,36 @@
+# A pool of worker processes (or threads, where processes
+# can't be forked), for the scripts that do a lot of image
+# work: edit-reflow.py, tex2mbm.py and tex2mbm-fast.py
+# (c) Silas S. Brown 2026.
+
+# (should work in either Python 2 or Python 3)
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+import sys
+
+def makePool():
+    import multiprocessing
+    try: return multiprocessing.get_context("fork").Pool()
+    except AttributeError: # Python 2
+        if not sys.platform.startswith("win"): return multiprocessing.Pool()
+    except ValueError: pass # no fork on this platform
+    from multiprocessing.pool import ThreadPool # (Pillow releases the GIL for most of its work)
+    return ThreadPool()
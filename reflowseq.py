@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# (should work in either Python 2 or Python 3)
+
+# reflowseq.py: the word sequence of a document made by
+# reflow.c, as edited by edit-reflow.py
+# (c) Silas S. Brown 2006-2009, 2012, 2020-2021, 2026.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+# A sequence is an array('i') of word numbers, with -1
+# for a pause: the same as sequence.dat, which is what
+# reflow.c's loadEditSequence reads.  Other scripts can
+# do e.g.:
+#   import reflowseq
+#   s = reflowseq.EditSequence(reflowseq.readTex())
+#   s.runCommands("delete 42-7 pause after 50".split())
+#   s.writeSequenceDat()
+
+import os
+from array import array
+
+def line2int(line):
+    # need to catch both \wordnumber{..} and \resizebox.. variants, so pick up on the {000000000.png}
+    return int(line[line.find(".png}")-9:line.find(".png}")])
+
+def readTex(fname="enlarged.tex"):
+    "Parse a .tex file written by reflow.c into a sequence"
+    return array('i',[line2int(l) if ".png}" in l else -1 for l in open(fname).readlines() if ".png}" in l or l.startswith("\\textcolor{blue}")]) # (textcolor lines are pauses that were already there, in case we're editing for a second time)
+
+def readSequenceDat(fname="sequence.dat",offset=0):
+    a = array('i') ; f = open(fname,"rb") ; f.seek(offset)
+    a.fromfile(f,(os.path.getsize(fname)-offset)//a.itemsize)
+    return a
+
+class EditSequence:
+    # A doubly-linked list of word numbers held in arrays,
+    # with an index from word number to the list nodes that
+    # hold it, so each edit costs time in proportion to the
+    # words it touches rather than to the document's length.
+    # Node 0 is the head (and tail) sentinel; unlinked nodes
+    # have prev -1.  Each linked node also has a label that
+    # increases along the list, so nodes can be sorted into
+    # document order.
+    labelGap = 1<<20 # (labels are doubles, exact to 2**53)
+    def __init__(self,words=()):
+        n = len(words)
+        self.val = array('i',[0]) ; self.val.extend(words)
+        self.next = array('i',range(1,n+1)) ; self.next.append(0)
+        self.prev = array('i',[n]) ; self.prev.extend(range(n))
+        self.label = array('d',[i*self.labelGap for i in range(n+1)])
+        self.firstNode = array('i',[0])*(max(words or [-1])+1) # word number -> first node that holds it (0 if none)
+        self.moreNodes = {} # word number -> list of any further nodes (copies)
+        firstNode = self.firstNode
+        for i in range(1,n+1):
+            w = words[i-1]
+            if w < 0: continue
+            if firstNode[w]: self.moreNodes.setdefault(w,[]).append(i)
+            else: firstNode[w] = i
+    def _index(self,n):
+        w = self.val[n]
+        if w < 0: return
+        if w >= len(self.firstNode): self.firstNode.extend(array('i',[0])*(w+1-len(self.firstNode)))
+        if self.firstNode[w]: self.moreNodes.setdefault(w,[]).append(n)
+        else: self.firstNode[w] = n
+    def newNode(self,word):
+        n = len(self.val)
+        self.val.append(word) ; self.prev.append(-1) ; self.next.append(-1) ; self.label.append(0)
+        self._index(n)
+        return n
+    def isLinked(self,n): return self.prev[n] != -1
+    def unlink(self,n):
+        nxt,prv = self.next[n],self.prev[n]
+        self.next[prv] = nxt ; self.prev[nxt] = prv
+        self.prev[n] = self.next[n] = -1
+    def _relabel(self): # rare: only when a gap between labels runs out
+        n = self.next[0] ; label = 0
+        while n:
+            label += self.labelGap ; self.label[n] = label
+            n = self.next[n]
+    def linkBefore(self,nodes,ref):
+        "Link unlinked nodes, in order, before node ref (0 = at the end)"
+        p = self.prev[ref]
+        if ref: top = self.label[ref]
+        else: top = self.label[p] + self.labelGap*(len(nodes)+1)
+        step = (top-self.label[p]) // (len(nodes)+1)
+        for n in nodes:
+            self.prev[n],self.next[n] = p,ref
+            self.next[p] = self.prev[ref] = n
+            self.label[n] = self.label[p] + step
+            p = n
+        if step < 1: self._relabel()
+    def nodesOf(self,word):
+        if word >= len(self.firstNode) or not self.firstNode[word]: return []
+        return [self.firstNode[word]] + self.moreNodes.get(word,[])
+    def findNodes(self,firstWord,lastWord):
+        "Linked nodes holding words firstWord to lastWord inclusive, in document order"
+        lastWord = min(lastWord,len(self.firstNode)-1) # (no point looking beyond the index)
+        r = []
+        for w in range(max(0,firstWord),lastWord+1): r += filter(self.isLinked, self.nodesOf(w))
+        r.sort(key=lambda n:self.label[n])
+        return r
+    def findIndex(self,firstWord,lastWord,beforeOrAfter="before"):
+        "Node to insert before, for 'before' or 'after' the first of these words, or None"
+        nodeList = self.findNodes(firstWord,lastWord)
+        if not nodeList:
+            print ("WARNING: findIndex failed on words %d-%d" % (firstWord,lastWord))
+            return None
+        node = nodeList[0]
+        if beforeOrAfter=="after": node = self.next[node]
+        return node
+    def toArray(self):
+        r = array('i') ; n = self.next[0]
+        while n:
+            r.append(self.val[n]) ; n = self.next[n]
+        return r
+    def writeSequenceDat(self,fname="sequence.dat",header=b""):
+        f = open(fname,"wb") ; f.write(header)
+        self.toArray().tofile(f) ; f.close()
+
+    # The edit-reflow.py command language (see its help text):
+    def runCommands(self,commands,colours={}):
+        "Apply one run's commands; returns {word number: colour} for any colour commands"
+        self.mode = self.colourToUse = "start" ; self.beforeOrAfter = "before"
+        self.keptNodes = None ; self.nodes_to_move = [] ; self.copy_mode = 0
+        self.wordToColour = {}
+        for cc in commands:
+            c = cc.lower()
+            if c in colours:
+                self.mode = "colour"
+                self.colourToUse = colours[c]
+            elif c in ["delete","keep","move","copy","to","pause"]: self.mode = c
+            elif c in ["before","after"]: self.beforeOrAfter = c
+            elif "-" in c:
+                if self.mode in ["colour","delete","keep","move"]: self.process(int(c[:c.find("-")]),int(c[c.find("-")+1:]))
+                else: print ("WARNING: '%s' cannot accept a range of values like '%s'; ignoring" % (self.mode,c))
+            else: self.process(int(c),int(c))
+        if self.keptNodes is not None:
+            for n in range(1,self.keepLimit):
+                if self.val[n]>=0 and self.isLinked(n) and not n in self.keptNodes: self.unlink(n)
+        return self.wordToColour
+    def process(self,firstWord,lastWord):
+        if lastWord<firstWord: lastWord=int(str(firstWord)[:len(str(firstWord))-len(str(lastWord))]+str(lastWord)) # so can say things like 124-8, 572-83, etc
+        mode = self.mode
+        if mode=="delete":
+            for n in self.findNodes(firstWord,lastWord): self.unlink(n)
+        elif mode=="keep":
+            if self.keptNodes is None:
+                self.keptNodes = set() ; self.keepLimit = len(self.val) # words copied after this are not affected by 'keep'
+            self.keptNodes.update(self.findNodes(firstWord,lastWord))
+        elif mode=="move" or mode=="copy":
+            self.nodes_to_move += self.findNodes(firstWord,lastWord)
+            self.copy_mode = (mode=="copy")
+        elif mode=="to":
+            if not self.copy_mode:
+                for n in self.nodes_to_move:
+                    if self.isLinked(n): self.unlink(n)
+            ref = self.findIndex(firstWord,lastWord,self.beforeOrAfter)
+            if ref is not None:
+                if self.copy_mode: toLink = [self.newNode(self.val[n]) for n in self.nodes_to_move]
+                else:
+                    seen = set() ; toLink = []
+                    for n in self.nodes_to_move:
+                        if not n in seen: toLink.append(n) ; seen.add(n) # (in case the same word was listed twice)
+                self.linkBefore(toLink,ref)
+            else: print ("WARNING: could not find where word %d is (in '... to %d'); ignoring that instruction" % (firstWord,firstWord))
+            self.nodes_to_move = []
+        elif mode=="pause":
+            ref = self.findIndex(firstWord,lastWord,self.beforeOrAfter)
+            if ref is not None: self.linkBefore([self.newNode(-1)],ref)
+            else: print ("WARNING: could not find where word %d is (in 'pause .. %d'); ignoring that instruction" % (firstWord,firstWord))
+        elif mode=="colour":
+            for w in range(firstWord,lastWord+1): self.wordToColour.setdefault(w,self.colourToUse)
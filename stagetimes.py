@@ -0,0 +1,112 @@
+# Time the stages of a tex2mbm.py or tex2mbm-fast.py run,
+# and write a report in JSON
+# (c) Silas S. Brown 2026.
+
+# (should work in either Python 2 or Python 3)
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+# For each stage we add up:
+#   wall: seconds spent in it (stages run in threads can
+#     overlap, so these can add up to more than the run)
+#   cpu: user+system seconds, including child processes
+#     (each one measured separately by wait4 where we have
+#     it, so overlapping stages don't get each other's)
+#     and pool workers (measured in the worker)
+#   bytes: size of what it wrote (files, or data in memory)
+#   items: pages, glyphs, files etc, as the stage counts them
+
+import os, sys, time, json, errno, threading, subprocess
+
+def cpuTime():
+    t = os.times() ; return t[0]+t[1]
+
+def sizeOf(files):
+    "Total size of the files that exist"
+    return sum([os.path.getsize(f) for f in files if os.path.exists(f)])
+
+def timedCall(args):
+    # (for pool workers: a worker has only the one thread, so
+    # its CPU time is the call's, unless it's a ThreadPool)
+    func,a = args ; t = cpuTime()
+    r = func(a)
+    return r,cpuTime()-t
+
+class StageTimes:
+    def __init__(self):
+        self.stages = {} ; self.order = [] ; self.lock = threading.Lock()
+        self.started = time.time() ; self.startCPU = os.times()
+    def add(self,stage,wall=0,cpu=0,written=0,items=0):
+        self.lock.acquire()
+        try:
+            if not stage in self.stages:
+                self.stages[stage] = [0.0,0.0,0,0] ; self.order.append(stage)
+            s = self.stages[stage]
+            s[0] += wall ; s[1] += cpu ; s[2] += written ; s[3] += items
+        finally: self.lock.release()
+    def start(self): return time.time(),cpuTime()
+    def stop(self,stage,started,written=0,items=0):
+        "Add the time since started=start() to stage (the CPU time is the whole process's, so includes other threads)"
+        self.add(stage,time.time()-started[0],cpuTime()-started[1],written,items)
+    def popen(self,stage,cmd,**kwargs):
+        "subprocess.Popen(cmd,shell=True), to be timed under stage by wait()"
+        p = subprocess.Popen(cmd,shell=True,**kwargs)
+        p.stage,p.started = stage,time.time()
+        return p
+    def wait(self,p,written=0,items=0):
+        "p.wait() for a popen() process, adding its times to its stage"
+        if hasattr(os,"wait4"):
+            while True:
+                try:
+                    pid,status,usage = os.wait4(p.pid,0) ; break
+                except OSError:
+                    if sys.exc_info()[1].errno != errno.EINTR: raise # (Python 2 doesn't retry)
+            if os.WIFSIGNALED(status): p.returncode = -os.WTERMSIG(status)
+            else: p.returncode = os.WEXITSTATUS(status)
+            cpu = usage.ru_utime+usage.ru_stime
+        else: # Windows: no CPU time for children
+            p.wait() ; cpu = 0
+        self.add(p.stage,time.time()-p.started,cpu,written,items)
+        return p.returncode
+    def call(self,stage,cmd,cwd=None):
+        "subprocess.call(cmd,shell=True,cwd=cwd), timed under stage"
+        return self.wait(self.popen(stage,cmd,cwd=cwd))
+    def imap(self,stage,pool,func,argList,chunksize=1):
+        """pool.imap(func,argList,chunksize), timed under stage
+        (wall time = time spent waiting for results, one item each)"""
+        results = pool.imap(timedCall,((func,a) for a in argList),chunksize)
+        while True:
+            t = time.time()
+            try: r,cpu = next(results)
+            except StopIteration: break
+            self.add(stage,time.time()-t,cpu,items=1)
+            yield r
+    def report(self):
+        t = os.times()
+        r = {"wall":round(time.time()-self.started,3),
+             "cpu":round(sum(t[:4])-sum(self.startCPU[:4]),3),
+             "stages":[]}
+        for stage in self.order:
+            wall,cpu,written,items = self.stages[stage]
+            r["stages"].append({"stage":stage,"wall":round(wall,3),"cpu":round(cpu,3),"bytes":written,"items":items})
+        return r
+    def write(self,fname):
+        "Write report() to fname as JSON"
+        o = open(fname,"w") ; json.dump(self.report(),o,indent=1,sort_keys=True) ; o.write("\n") ; o.close()
@@ -0,0 +1,124 @@
+# Tests for mbmfile.py (python -m unittest test_mbmfile, or
+# pytest): bitmaps written and read back, RLE decoded, with
+# and without numpy
+# (c) Silas S. Brown 2026.
+
+# (should work in either Python 2 or Python 3)
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+import os, random, struct, binascii, tempfile, unittest
+import mbmfile
+from testutil import withAndWithoutNumpy
+from mbmfile import flags, epocColour16, byteRLE, mbmBitmap, pixelValues, pack, readPPM, writeMBM, bitmapRanges, twips
+
+def unRLE(data):
+    "Decode EPOC byte run-length encoding (written independently of byteRLE)"
+    data = bytearray(data) ; out = bytearray() ; i = 0
+    while i < len(data):
+        n = data[i]
+        if n < 128: out += bytearray([data[i+1]])*(n+1) ; i += 2
+        else: out += data[i+1:i+1+256-n] ; i += 1+256-n
+    return bytes(out)
+
+def unpack(w,h,data,bpp):
+    "Pixel values from rows packed at bpp bits (first pixel in the low bits), padded to 4 bytes"
+    data = bytearray(data) ; rowBytes = (w*bpp+31)//32*4 ; v = bytearray()
+    assert len(data)==rowBytes*h, "wrong data length"
+    for y in range(h):
+        for x in range(w):
+            v.append((data[y*rowBytes+x*bpp//8] >> (x*bpp%8)) & ((1<<bpp)-1))
+    return v
+
+def randomPPM(r,w,h,colours):
+    return ("P6\n%d %d\n255\n" % (w,h)).encode("latin1") + bytes(bytearray([v for i in range(w*h) for v in r.choice(colours)]))
+
+class TestRLE(unittest.TestCase):
+    def test_roundTrip(self):
+        r = random.Random(1)
+        cases = ["".encode("latin1")] + [bytes(bytearray([7]*n)) for n in [1,2,3,127,128,129,300]] + [bytes(bytearray(range(n%256)))*(n//256+1) for n in [1,2,127,128,129,255]]
+        for i in range(200): # random mixtures of runs and literals
+            d = bytearray()
+            while len(d) < 400:
+                if r.random() < 0.5: d += bytearray([r.randrange(4)])*r.randrange(1,200)
+                else: d += bytearray([r.randrange(256) for j in range(r.randrange(1,200))])
+            cases.append(bytes(d))
+        for d in cases:
+            e = byteRLE(d)
+            self.assertEqual(unRLE(e),d)
+            self.assertTrue(len(e) <= len(d)+(len(d)+127)//128) # (never much bigger)
+
+class TestBitmaps(withAndWithoutNumpy(mbmfile)):
+    def test_records(self):
+        r = random.Random(2)
+        colourSets = {"/1":[(0,0,0),(255,255,255)], "/2":[(0,0,0),(0x55,0x55,0x55),(0xaa,0xaa,0xaa),(255,255,255)], "/4":[(v,v,v) for v in range(0,256,17)], "/c4":epocColour16}
+        for flag,(bpp,colour) in flags.items():
+            for w in list(range(1,35))+[64,65]:
+                h = r.randrange(1,6) ; ppm = randomPPM(r,w,h,colourSets[flag])
+                for compress in [0,1]:
+                    rec = mbmBitmap((ppm,flag,compress))
+                    header = struct.unpack("<10I",rec[:40])
+                    self.assertEqual(header,(len(rec),40,w,h,twips(w),twips(h),bpp,colour,0,compress))
+                    data = rec[40:]
+                    if compress: data = unRLE(data)
+                    values = pixelValues(w,h,readPPM(ppm)[2],bpp,colour)
+                    self.assertEqual(data,pack(w,h,values,bpp))
+                    self.assertEqual(unpack(w,h,data,bpp),values)
+                    pixels = readPPM(ppm)[2] ; expected = bytearray()
+                    for i in range(w*h): # (these colours are exact, so no rounding)
+                        rgb = tuple(pixels[3*i:3*i+3])
+                        if colour: expected.append(epocColour16.index(rgb))
+                        else: expected.append(rgb[0]*((1<<bpp)-1)//255)
+                    self.assertEqual(unpack(w,h,data,bpp),expected)
+    def test_file(self):
+        r = random.Random(3)
+        recs = [mbmBitmap((randomPPM(r,r.randrange(1,40),r.randrange(1,10),epocColour16),"/c4",i%2)) for i in range(20)]
+        fd,fname = tempfile.mkstemp(".mbm") ; os.close(fd)
+        try:
+            writeMBM(fname,recs) ; dat = open(fname,"rb").read()
+        finally: os.remove(fname)
+        self.assertEqual(struct.unpack("<4I",dat[:16]),(0x10000037,0x10000042,0,0x47396439))
+        self.assertEqual([dat[s:e] for s,e in bitmapRanges(dat)],recs)
+
+# A reference file put together by hand from the layout (not
+# by writeMBM): a 3x2 black & white bitmap (black white black,
+# white white black) and an 8x1 all-white one compressed
+referenceMBM = (
+    "37000010" "42000010" "00000000" "39643947" "70000000" # UIDs, checksum, trailer offset (112)
+    "30000000" "28000000" "03000000" "02000000" "2d000000" "1e000000" # 48 bytes, header 40, 3x2, 45x30 twips
+    "01000000" "00000000" "00000000" "00000000" # 1 bpp, grey, no palette, not compressed
+    "02000000" "03000000" # rows (first pixel in the low bit, 1 = white, padded to 4 bytes)
+    "2c000000" "28000000" "08000000" "01000000" "78000000" "0f000000" # 44 bytes, header 40, 8x1, 120x15 twips
+    "01000000" "00000000" "00000000" "01000000" # 1 bpp, grey, no palette, RLE
+    "ffff0200" # 0xff once, then 0 three times
+    "02000000" "14000000" "44000000") # trailer: 2 bitmaps, at 20 and 68
+
+class TestReference(withAndWithoutNumpy(mbmfile)):
+    def test_reference(self):
+        b,w = (0,0,0),(255,255,255)
+        recs = [mbmBitmap((("P6\n3 2\n255\n").encode("latin1")+bytes(bytearray([v for c in [b,w,b,w,w,b] for v in c])),"/1",0)),
+                mbmBitmap((("P6\n8 1\n255\n").encode("latin1")+bytes(bytearray([255]*24)),"/1",1))]
+        fd,fname = tempfile.mkstemp(".mbm") ; os.close(fd)
+        try:
+            writeMBM(fname,recs) ; dat = open(fname,"rb").read()
+        finally: os.remove(fname)
+        self.assertEqual(binascii.hexlify(dat).decode("latin1"),referenceMBM)
+
+if __name__=="__main__": unittest.main()
@@ -0,0 +1,109 @@
+# Tests for pagebitmaps.py (python -m unittest test_pagebitmaps,
+# or pytest): colour remapping and Bmconv flags, with and
+# without numpy
+# (c) Silas S. Brown 2026.
+
+# (should work in either Python 2 or Python 3)
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+import os, random, tempfile, unittest
+import pagebitmaps
+from testutil import withAndWithoutNumpy
+from pagebitmaps import epoc16, epoc4, epoc2, remapPixels, remapPage, bmconvFlag
+
+def bruteNearest(rgb,palette=epoc16):
+    "Nearest colour in palette by trying all of them (what pnmremap -nofs does)"
+    best = None
+    for c in palette:
+        d = (rgb[0]-c[0])**2 + (rgb[1]-c[1])**2 + (rgb[2]-c[2])**2
+        if best is None or d < best[0]: best = (d,c)
+    return best[1]
+
+def pixelBytes(rgbList): return bytes(bytearray([v for rgb in rgbList for v in rgb]))
+
+def sampleColours():
+    r = random.Random(1) # (same every time)
+    colours = [(r.randrange(256),r.randrange(256),r.randrange(256)) for i in range(20000)]
+    colours += [(v,v,v) for v in range(256)] # greys (43 and 213-215 went wrong with quantize)
+    colours += [(3,71,32),(250,233,158)] + list(epoc16)
+    return colours
+
+class TestRemap(withAndWithoutNumpy(pagebitmaps)):
+    def test_nearest(self):
+        colours = sampleColours()
+        out = bytearray(remapPixels(pixelBytes(colours)))
+        for i,rgb in enumerate(colours):
+            self.assertEqual(tuple(out[3*i:3*i+3]),bruteNearest(rgb),"%r" % (rgb,))
+    def test_examples(self):
+        self.assertEqual(bytearray(remapPixels(pixelBytes([(3,71,32),(250,233,158)]))),bytearray(pixelBytes([(0,136,0),(255,255,255)])))
+
+@unittest.skipIf(not pagebitmaps.Image,"needs Pillow")
+class TestRemapPage(withAndWithoutNumpy(pagebitmaps)):
+    def test_page(self):
+        from PIL import Image
+        im = Image.new("RGB",(50,20),(255,255,255))
+        im.putpixel((10,5),(3,71,32)) ; im.putpixel((20,15),(250,233,0))
+        fd,fname = tempfile.mkstemp(".png") ; os.close(fd)
+        try:
+            im.save(fname) ; dat = remapPage((fname,None))
+        finally: os.remove(fname)
+        self.assertTrue(dat.startswith("P6\n11 16\n255\n".encode("latin1"))) # (cropped left, right and bottom, not top)
+        pixels = bytearray(dat[len("P6\n11 16\n255\n"):])
+        self.assertEqual(tuple(pixels[3*(5*11):3*(5*11)+3]),(0,136,0))
+        self.assertEqual(tuple(pixels[3*(15*11+10):3*(15*11+10)+3]),(255,255,0))
+        self.assertEqual(set(zip(pixels[0::3],pixels[1::3],pixels[2::3])),set([(255,255,255),(0,136,0),(255,255,0)]))
+
+def ppmOf(rgbList,w=None):
+    if not w: w = len(rgbList)
+    return ("P6\n%d %d\n255\n" % (w,len(rgbList)//w)).encode("latin1") + pixelBytes(rgbList)
+
+def oldFlag(rgbList):
+    """The flag as tex2mbm.py used to choose it with pnmremap: remap
+    to the 4 greys and back to the 16 colours, and if that changed
+    nothing then remap to black & white and back"""
+    def same(palette): return [bruteNearest(bruteNearest(c,palette)) for c in rgbList] == list(rgbList)
+    if not same(epoc4): return "/c4"
+    if same(epoc2): return "/1"
+    return "/2"
+
+black,white,darkGrey,lightGrey = (0,0,0),(255,255,255),(0x55,0x55,0x55),(0xaa,0xaa,0xaa)
+flagCorpus = [ # (pixels, width, expected flag)
+    ([white]*6,3,"/1"), ([black]*4,2,"/1"), ([black,white]*8,4,"/1"),
+    ([black,white,darkGrey,white],2,"/2"), ([lightGrey,white],1,"/2"),
+    ([black,darkGrey,lightGrey,white]*3,6,"/2"),
+    ([black,white,(255,0,0),white],2,"/c4"), ([darkGrey,(0,136,0)],2,"/c4"),
+    ([(0x99,0x99,0)],1,"/c4"), ([(0,0,0xff)]+[black]*99,10,"/c4"),
+    ] + [([white,c],2,c in epoc2 and "/1" or c in epoc4 and "/2" or "/c4") for c in epoc16]
+
+class TestBmconvFlag(withAndWithoutNumpy(pagebitmaps)):
+    def test_corpus(self):
+        for pixels,w,flag in flagCorpus:
+            self.assertEqual(oldFlag(pixels),flag,"%r" % (pixels,)) # (the corpus agrees with the old pnmremap way)
+            self.assertEqual(bmconvFlag(ppmOf(pixels,w)),flag,"%r" % (pixels,))
+    def test_remapped(self):
+        r = random.Random(2)
+        for i in range(200): # (small pages of random colours, as remapPage would give)
+            n = r.randrange(1,20) ; pixels = bytearray(remapPixels(pixelBytes([(r.randrange(256),r.randrange(256),r.randrange(256)) for j in range(n)])))
+            pixels = list(zip(pixels[0::3],pixels[1::3],pixels[2::3]))
+            self.assertEqual(bmconvFlag(ppmOf(pixels)),oldFlag(pixels))
+        for c in epoc16: self.assertEqual(bmconvFlag(ppmOf([c])),oldFlag([c]))
+
+if __name__=="__main__": unittest.main()
@@ -0,0 +1,37 @@
+# Things shared by the tests (test_*.py)
+# (c) Silas S. Brown 2026.
+
+# (should work in either Python 2 or Python 3)
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Where to find history:
+# on GitHub at https://github.com/ssb22/scan-reflow
+# and on GitLab at https://gitlab.com/ssb22/scan-reflow
+# and on BitBucket https://bitbucket.org/ssb22/scan-reflow
+# and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
+# and in China: https://gitee.com/ssb22/scan-reflow
+
+import unittest
+
+def withAndWithoutNumpy(module):
+    "A TestCase base class that runs each test with module's numpy (if it's installed) and then without"
+    class WithAndWithoutNumpy(unittest.TestCase):
+        def run(self,result=None):
+            realNumpy = module.numpy
+            try:
+                if realNumpy: unittest.TestCase.run(self,result)
+                module.numpy = None
+                unittest.TestCase.run(self,result)
+            finally: module.numpy = realNumpy
+    return WithAndWithoutNumpy
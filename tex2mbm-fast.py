@@ -24,6 +24,16 @@ device_resolution = (640, 480)  # for S7
 # bmconv_command = "cp /other/downloads/bmconv/Bmconv.exe . && wine Bmconv.exe"
 bmconv_command = "~/bin/Bmconv.exe"
 
+use_bmconv = True # if False, the .mbm files are written
+# by this script (see mbmfile.py) and bmconv_command
+# is not needed.  That's checked only against a file put
+# together by hand (test_mbmfile.py), not yet against files
+# made by Bmconv, so it's not the default yet.
+compress_mbm = False # if True (and not use_bmconv),
+# use EPOC's byte run-length compression in the .mbm files
+glyphs_per_mbm = 510 # MbmShow expects 510 per file (and
+# Bmconv can't take more)
+
 # The following variables are used for setting the
 # font size etc of TeX files, and are ignored for
 # .ps files which the program assumes are already
@@ -53,9 +63,35 @@ just_print_Bmconv_commands = False # if non-False,
 
 also_make_HTML_files = False
 also_make_compressed_XBM = False
+compressed_XBM_format = 1 # 2 for an images.dat about
+# half the size, but each glyph then takes XBMshow.py
+# 2-10 times as long to decode (and XBMshow.py versions
+# before datfiles.py can't read it at all)
 
 leave_tex_logs = False # set if you don't want them deleted
 
+gs_processes = 0 # number of gs processes to run at
+# once, each on its own range of pages (0 = one per CPU)
+
+glyph_cache_dir = None # a directory to keep cropped
+# glyphs in between runs (e.g. "~/.tex2mbm-cache"), so
+# only new or changed words need typesetting
+glyph_cache_megabytes = 200 # least recently used glyphs
+# are removed from the cache when it's bigger than this
+
+bmconv_processes = 0 # number of bmconv batches (of up
+# to 510 images) to run at once (0 = one per CPU)
+
+documents_per_bundle = 0 # if non-zero, the output is
+# split into bundle001, bundle002 etc of this many input
+# files each, with only the glyphs those files use, so
+# each bundle for the device can be kept small
+
+timing_report = "tex2mbm-timings.json" # time, CPU,
+# bytes written and items done by each stage (latex,
+# dvips, gs, crop, digest, convert, mbm or bmconv, zip
+# etc), in JSON (None = don't write it)
+
 # --- End of variables that need changing -----
 
 # Licensed under the Apache License, Version 2.0 (the "License");
@@ -77,33 +113,41 @@ leave_tex_logs = False # set if you don't want them deleted
 # and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
 # and in China: https://gitee.com/ssb22/scan-reflow
 
-import os, re
+import os, re, imp, shutil, hashlib, multiprocessing
+from multiprocessing.pool import ThreadPool
+from datfiles import SequenceWriter, ImagesDatWriter
+from pagebitmaps import makePool, convertPage, cropPageTo, glyphDigest, mbmBitmapFromPNG, xbmGlyph
+from mbmfile import writeMBM
+from stagetimes import StageTimes, sizeOf
+from bundles import makeBundles
+times = StageTimes()
 baseFilename = "font"
+if use_bmconv: glyphs_per_mbm = min(glyphs_per_mbm,510)
+else: just_print_Bmconv_commands = False
+assert not (documents_per_bundle and just_print_Bmconv_commands), "documents_per_bundle needs the .mbm files, so can't be used with just_print_Bmconv_commands"
 dpi_to_set_at = 100 # regardless of actual device DPI - be nice to metafont
 papersize_px = (device_resolution[0],device_resolution[1]/lines_per_screen)
 fontsize_px = papersize_px[1] / max_symbol_height
 fontsize_pt = fontsize_px * 72.0 / dpi_to_set_at
 papersize_mm = tuple(map(lambda x: x*25.4/dpi_to_set_at, papersize_px))
-latex_paper_command = "margin_left=0 margin_top=0 paper_width="+str(papersize_mm[0])+" paper_height="+str(papersize_mm[1])+" python \""+path_to_latexPapersize+"\" "+str(baseSize_points)+" "+str(fontsize_pt)+" "
 
 assert open(path_to_latexPapersize), "path_to_latexPapersize does not appear to be set properly" # (more likely to raise IOError than AssertionError, but still)
-startString = documentClass + os.popen(latex_paper_command+"tex").read()
+t = times.start()
+latexPapersize = imp.load_source("latex_papersize",path_to_latexPapersize) # (in-process, rather than a new Python for every call)
+paperGeometry = latexPapersize.geometry(baseSize_points,fontsize_pt,papersize_mm[0],papersize_mm[1],0,0)
+startString = documentClass + latexPapersize.texSettings(paperGeometry) + "\n" # (as it was when printed, so glyph cache keys stay the same)
+times.stop("latex-papersize",t)
 startString += "\\usepackage[T1]{fontenc}" # hack to ensure uses bitmaps not outlines in teTeX 2+ (not needed in teTeX 1)
 
 tempDir = os.popen("mktemp -d").read().strip()
 
 texToCharNo = {} ; charNoToTex = {} ; charNoToFlag = {}
-bmconv_params = []
-seq=open("sequence.dat","w")
-contents = open("contents.dat","w")
+bmconv_params = [] ; docs = [] # (list of character numbers for each input file)
 
 oldDir = os.getcwd()
 
 first_file_preamble = last_file_end = None
 
-def lsbmsb16(num): return chr(num%256)+chr(num/256)
-def lsbmsb32(num): return lsbmsb16(num%65536)+lsbmsb16(num/65536)
-
 for inputFile in sys.argv[1:]:
     dat = open(inputFile).read().replace("\r\n","\n")
     if not first_file_preamble:
@@ -111,11 +155,7 @@ for inputFile in sys.argv[1:]:
         for thing in "documentclass textwidth textheight topmargin marginparwidth oddsidemargin evensidemargin".split(): assert not "\\"+thing in first_file_preamble, "TeX files must NOT contain \\"+thing+" (this will be added by the script)"
     else: assert first_file_preamble==dat[:dat.index("\n%StartWord\n")]+"\n", "All TeX files must contain identical material before the first %StartWord"
     last_file_end = dat[dat.rindex("\n%EndWord\n"):]
-    if also_make_HTML_files:
-        fileNo = contents.tell()/4
-        htmlFile=open("%05d.html" % fileNo,"w")
-        htmlFile.write("<HTML><BODY>\n")
-    contents.write(lsbmsb32(seq.tell()))
+    docs.append([])
     for word in dat.split("\n%StartWord\n")[1:]:
         word += "\n" ; word=word[:word.index("\n%EndWord\n")+1] # +1 to include the \n
         if not word.strip(): continue # ignore any completely-blank 'words'
@@ -126,97 +166,207 @@ for inputFile in sys.argv[1:]:
             elif "%Grey" in word: charNoToFlag[c]="/2"
             else: charNoToFlag[c]="/1"
             texToCharNo[word]=c
-        seq.write(lsbmsb16(texToCharNo[word]))
-        if also_make_HTML_files: htmlFile.write("<IMG SRC=%08d.png>\n" % texToCharNo[word])
+        docs[-1].append(texToCharNo[word])
+os.chdir(tempDir)
+# Look each word up in the glyph cache (cropped PNGs named
+# by a hash of everything that affects how they look);
+# only the ones that aren't there need typesetting
+if glyph_cache_dir:
+    cacheDir = os.path.expanduser(glyph_cache_dir)
+    if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+else: cacheDir = tempDir
+# The top of each glyph is left uncropped for alignment, so
+# glyphs from different runs line up only if dvips puts the
+# origin in the same place: the outermost ink of all the
+# words typeset so far, kept with the cache (and in the
+# cache key).  If new words have ink above or to the left of
+# it, everything is typeset again from there (rather than
+# clip them), after which it's needed only for more extreme
+# words than any before
+settings = "\0".join([startString,first_file_preamble,repr(device_resolution),repr(dpi_to_set_at)])
+originFile = cacheDir+os.sep+hashlib.sha1(settings).hexdigest()+".origin"
+if glyph_cache_dir and os.path.exists(originFile): origin = tuple(map(float,open(originFile).read().split()))
+else: origin = None
+def cacheFile(c): return cacheDir+os.sep+hashlib.sha1("\0".join([settings,charNoToTex[c],repr(origin)])).hexdigest()+".png"
+missing = []
+for c in range(len(charNoToTex)):
+    if origin and os.path.exists(cacheFile(c)): os.utime(cacheFile(c),None) # (for least-recently-used eviction)
+    else: missing.append(c)
+print len(charNoToTex)-len(missing),"of",len(charNoToTex),"glyphs were cached"
+pool = makePool()
+def typeset(chars):
+    open("tmp.tex","w").write(startString+first_file_preamble+"\n".join(map(lambda c: charNoToTex[c], chars))+last_file_end)
+    ret = times.call("latex","latex tmp.tex")
+    assert not ret, "TeX error"
+    times.add("latex",written=sizeOf(["tmp.dvi"]),items=len(chars))
+if missing:
+    typeset(missing)
+    t = times.start() ; inkOrigin = latexPapersize.findOrigin(paperGeometry,"tmp.dvi") ; times.stop("latex-papersize",t)
+    if not origin: origin = inkOrigin
+    elif inkOrigin[0] < origin[0] or inkOrigin[1] < origin[1]:
+        print "New words go beyond the cached glyphs' origin: typesetting all of them again"
+        origin = (min(origin[0],inkOrigin[0]),min(origin[1],inkOrigin[1]))
+        missing = list(range(len(charNoToTex))) ; typeset(missing)
+    if glyph_cache_dir: open(originFile,"w").write("%r %r\n" % origin)
+    t = times.start() ; dvips = latexPapersize.dvipsCommand(paperGeometry,"tmp.dvi",origin=origin) ; times.stop("latex-papersize",t)
+    ret = times.call("dvips",dvips+" -o tmp.ps -D "+str(dpi_to_set_at))
+    assert not ret, "dvips error"
+    times.add("dvips",written=sizeOf(["tmp.ps"]),items=len(missing))
+    print "Running gs to get PNGs"
+    if not gs_processes:
+        try: gs_processes = multiprocessing.cpu_count()
+        except: gs_processes = 1
+    pagesPerProcess = -(-len(missing) // gs_processes) or 1
+    def runGS(firstPage,lastPage=""): return (firstPage,times.popen("gs","gs -sDEVICE=png16 -sOutputFile=tmp%08d-%%08d.png -dFirstPage=%d%s -g%dx%d -r%dx%d -q -dNOPAUSE -dBATCH tmp.ps" % (firstPage,firstPage,lastPage,papersize_px[0],papersize_px[1],dpi_to_set_at,dpi_to_set_at)))
+    def rangePNGs(firstPage): return sorted(filter(lambda f:f.startswith("tmp%08d-" % firstPage),os.listdir(".")))
+    gsRuns = []
+    for firstPage in range(1,len(missing)+1,pagesPerProcess):
+        if firstPage+pagesPerProcess > len(missing): lastPage = "" # last range: include any trailing pages, as the loop below expects
+        else: lastPage = " -dLastPage=%d" % (firstPage+pagesPerProcess-1)
+        gsRuns.append(runGS(firstPage,lastPage))
+    for firstPage,p in gsRuns: assert not times.wait(p), "gs error"
+    if [1 for firstPage,p in gsRuns[:-1] if not len(rangePNGs(firstPage))==pagesPerProcess]:
+        # older gs ignores -dFirstPage/-dLastPage on PostScript
+        # and renders every page each time, which would number
+        # them wrongly below: do it again with only one gs
+        print "gs did not render the page ranges it was given: running it once on all the pages instead"
+        for firstPage,p in gsRuns:
+            for f in rangePNGs(firstPage): os.remove(f)
+        gsRuns = [runGS(1)] ; assert not times.wait(gsRuns[0][1]), "gs error"
+    for firstPage,p in gsRuns: # number the pages as a single gs would have done
+        prefix = "tmp%08d-" % firstPage
+        for f in rangePNGs(firstPage):
+            os.rename(f,"tmp%08d.png" % (firstPage+int(f[len(prefix):-4])-1))
+    print "Trimming PNGs"
+    pngs = sorted(filter(lambda f:f.startswith("tmp") and f.endswith(".png"),os.listdir(".")))
+    times.add("gs",written=sizeOf(pngs),items=len(pngs))
+    assert len(pngs)>=len(missing), "Not enough pages were generated (maybe some of your words did not actually generate pages?)"
+    count = 0
+    for f,made in zip(pngs,times.imap("crop",pool,cropPageTo,[(f,"c"+f) for f in pngs],8)): # (in parallel, but in order)
+        if count==len(missing): break # already had enough pages - rest is probably a blank one at the end
+        if not made: continue # maybe it was a blank page - ignore it
+        times.add("crop",written=sizeOf(["c"+f]))
+        shutil.move("c"+f,cacheFile(missing[count]))
+        count += 1
+    assert count==len(missing), "Not enough non-blank pages were generated"
+# Words with different TeX can still come out the same
+# (spacing, comments, equivalent macros), so number the
+# glyphs by bitmap, in order of first appearance
+charNoToGlyph = [] ; glyphToCharNo = [] ; glyphToFlag = [] ; digestToGlyph = {}
+flagOrder = ["/1","/2","/c4"]
+for c,digest in enumerate(times.imap("digest",pool,glyphDigest,[cacheFile(c) for c in range(len(charNoToTex))],8)):
+    if digest in digestToGlyph:
+        g = digestToGlyph[digest]
+        glyphToFlag[g] = max(glyphToFlag[g],charNoToFlag[c],key=flagOrder.index)
+    else:
+        g = digestToGlyph[digest] = len(glyphToCharNo)
+        glyphToCharNo.append(c) ; glyphToFlag.append(charNoToFlag[c])
+    charNoToGlyph.append(g)
+del digestToGlyph
+print len(charNoToTex),"different words made",len(glyphToCharNo),"different glyphs"
+seq = SequenceWriter(oldDir) # (sequence.dat and contents.dat)
+for fileNo in range(len(docs)):
+    seq.startDoc()
+    seq.add([charNoToGlyph[c] for c in docs[fileNo]])
     if also_make_HTML_files:
+        htmlFile=open(oldDir+os.sep+("%05d.html" % fileNo),"w")
+        htmlFile.write("<HTML><BODY>\n")
+        for c in docs[fileNo]: htmlFile.write("<IMG SRC=%08d.png>\n" % charNoToGlyph[c])
         htmlFile.write("<BR>")
-        if not inputFile==sys.argv[-1]: htmlFile.write("<A HREF=%05d.html>Next</A>\n" % (fileNo+1))
+        if fileNo+1 < len(docs): htmlFile.write("<A HREF=%05d.html>Next</A>\n" % (fileNo+1))
         if fileNo: htmlFile.write("<A HREF=%05d.html>Previous</A>\n" % (fileNo-1))
         htmlFile.write("</BODY></HTML>")
         htmlFile.close()
-l = charNoToTex.items() ; l.sort()
-os.chdir(tempDir)
-open("tmp.tex","w").write(startString+first_file_preamble+"\n".join(map(lambda (x,y): y, l))+last_file_end)
-ret = os.system("latex tmp.tex")
-assert not ret, "TeX error"
-ret = os.system(os.popen(latex_paper_command+"tmp.dvi").read().strip()+" -o tmp.ps -D "+str(dpi_to_set_at))
-assert not ret, "dvips error"
-print "Running gs to get PNGs"
-ret = os.system("gs -sDEVICE=png16 -sOutputFile=tmp%%08d.png -g%dx%d -r%dx%d -q -dNOPAUSE - < tmp.ps" % (papersize_px[0],papersize_px[1],dpi_to_set_at,dpi_to_set_at))
-assert not ret, "gs error"
-print "Trimming PNGs"
-pngs = os.listdir(os.getcwd()) ; pngs.sort()
-assert len(pngs)>=len(texToCharNo), "Not enough pages were generated (maybe some of your words did not actually generate pages?)"
-count = 0
-for f in pngs:
-    if count==len(texToCharNo): break # already had enough pages - rest is probably a blank one at the end
-    if not f.endswith(".png"): continue # ignore
-    dat=os.popen('pngtopnm "'+f+'" | pnmcrop -white -left -right -bottom').read() # (don't crop top because we're using it for alignment)
-    if not dat: continue # maybe it was a blank page (pnmcrop error) - ignore it
-    flag = charNoToFlag[count]
-    fname="%08d.bmp" % count
-    bmconv_params.append(flag+fname)
-    if also_make_HTML_files: os.popen("pnmtopng -compression 9 > \""+oldDir+os.sep+("%08d.png" % count)+"\"","w").write(dat)
-    if also_make_compressed_XBM: os.popen("ppmtopgm|pgmtopbm -threshold | pbmtoxbm > \""+oldDir+os.sep+("%08d.xbm" % count)+"\"","w").write(dat)
-    count += 1
-    os.popen("ppmtobmp > "+fname,"w").write(dat)
-    print "Done",count,"of",len(texToCharNo)
+print "Converting glyphs"
+for g,made in enumerate(times.imap("convert",pool,convertPage,[(cacheFile(c),"%08d" % g,use_bmconv,also_make_HTML_files) for g,c in enumerate(glyphToCharNo)],8)):
+    bmconv_params.append(glyphToFlag[g]+("%08d.bmp" % g))
+    if also_make_HTML_files: shutil.move("%08d.png" % g,oldDir+os.sep+("%08d.png" % g))
+    print "Done",g+1,"of",len(glyphToCharNo)
+glyphPNGs = [cacheFile(c) for c in glyphToCharNo]
 if not leave_tex_logs: os.system("find . -name 'tmp*' | xargs rm") # leaves the .bmp files
-AllUnique = (seq.tell()/2 == len(texToCharNo))
-ContentsNotNeeded = (contents.tell() == 4) # only 1 document
-del texToCharNo, charNoToTex, charNoToFlag, contents, seq
-startPoints=range(0,len(bmconv_params),510)+[len(bmconv_params)]
+AllUnique = (seq.count == len(glyphToCharNo))
+ContentsNotNeeded = (len(docs) == 1) # only 1 document
+seq.close()
+del texToCharNo, charNoToTex, charNoToFlag, charNoToGlyph, glyphToCharNo, glyphToFlag, docs, seq
+startPoints=range(0,len(bmconv_params),glyphs_per_mbm)+[len(bmconv_params)]
+# (each batch is converted in its own directory, several at once)
+batches = []
 for i in range(len(startPoints)-1):
     if i==0: extra=""
     else: extra=hex(i)[2:].upper() # (drop '0x' at beginning)
+    if not use_bmconv:
+        bitmaps = list(times.imap("mbm",pool,mbmBitmapFromPNG,[(glyphPNGs[g],bmconv_params[g][:-12],compress_mbm) for g in range(startPoints[i],startPoints[i+1])])) # (bmconv_params has the flag then %08d.bmp)
+        t = times.start() ; mbm = oldDir+os.sep+baseFilename+extra+".mbm"
+        writeMBM(mbm,bitmaps) ; del bitmaps
+        times.stop("mbm",t,written=sizeOf([mbm]))
+        continue
     this_cmd = bmconv_command+" "+baseFilename+extra+".mbm "+' '.join(bmconv_params[startPoints[i]:startPoints[i+1]])
     if just_print_Bmconv_commands: just_print_Bmconv_commands.write(this_cmd+"\n")
-    else: 
-        ret=os.system(this_cmd)
-        assert not ret, "bmconv_command exitted with an error"
-        os.system("mv "+baseFilename+extra+".mbm \""+oldDir+"\"")
+    else:
+        batchDir = "batch%d" % i ; os.mkdir(batchDir)
+        for p in bmconv_params[startPoints[i]:startPoints[i+1]]: os.rename(p[-12:],batchDir+os.sep+p[-12:]) # (flag then %08d.bmp)
+        batches.append((this_cmd,os.path.abspath(batchDir),baseFilename+extra+".mbm"))
+def runBmconv(batch):
+    ret = times.call("bmconv",batch[0],batch[1])
+    times.add("bmconv",written=sizeOf([batch[1]+os.sep+batch[2]]),items=1)
+    return ret
+if batches:
+    bmconvPool = ThreadPool(bmconv_processes or None) # (threads are enough: the work is in the bmconv processes)
+    for ret in bmconvPool.map(runBmconv,batches): assert not ret, "bmconv_command exitted with an error"
+    bmconvPool.close()
+for this_cmd,batchDir,mbm in batches: shutil.move(batchDir+os.sep+mbm,oldDir+os.sep+mbm)
+if also_make_compressed_XBM: # (written as the glyphs come, so there's only ever a few in memory)
+    images = ImagesDatWriter(oldDir+os.sep+"images.dat",compressed_XBM_format,len(glyphPNGs))
+    for w,h,rows in times.imap("images.dat",pool,xbmGlyph,glyphPNGs,8): images.add(w,h,rows)
+    images.close() ; times.add("images.dat",written=sizeOf([oldDir+os.sep+"images.dat"]))
+pool.close() ; del glyphPNGs
+if glyph_cache_dir: # evict least recently used
+    cached = [(os.stat(cacheDir+os.sep+f).st_mtime,cacheDir+os.sep+f) for f in os.listdir(cacheDir) if f.endswith(".png")]
+    cached.sort() ; size = sum([os.path.getsize(f) for t,f in cached])
+    while cached and size > glyph_cache_megabytes*1048576:
+        size -= os.path.getsize(cached[0][1])
+        os.remove(cached[0][1]) ; del cached[0]
 os.chdir(oldDir)
 # clean up, zip, print report
 toPrint = ["\n--------------------------"] ; toZip = []
-if ContentsNotNeeded:
-    toPrint.append("Didn't make contents.dat, as there was only one input document")
-    os.remove("contents.dat")
-else:
-    toPrint.append("Made contents.dat")
-    toZip.append("contents.dat")
-    AllUnique = False # because we DO make sequence.dat if we made contents.dat
-if AllUnique:
-    toPrint.append("Didn't make sequence.dat, as all images were unique")
-    os.remove("sequence.dat")
-else:
-    toPrint.append("Made sequence.dat")
-    toZip.append("sequence.dat")
-if just_print_Bmconv_commands:
-    print "\n".join(toPrint)
-    print "Made bmconv commands (which should be run using the *.bmp files in %s)" % (tempDir,)
-else:
+if documents_per_bundle: # (each bundle zipped on its own)
     os.system("rm -rf \"%s\"" % (tempDir,))
-    toPrint.append("Made "+baseFilename+"*.mbm")
-    toZip.append(baseFilename+"*.mbm")
-    assert not " " in baseFilename, "you'll be sorry..."
-    os.system("zip -9 to-epoc.zip "+" ".join(toZip)+" && rm "+" ".join(toZip))
+    for bundleDir,files in makeBundles(baseFilename,documents_per_bundle,glyphs_per_mbm,oldDir):
+        times.call("zip","zip -9 to-epoc.zip "+" ".join(files)+" && rm "+" ".join(files),bundleDir)
+        times.add("zip",written=sizeOf([bundleDir+os.sep+"to-epoc.zip"]),items=1)
+        toPrint.append("Made "+bundleDir+os.sep+"to-epoc.zip ("+", ".join(files)+")")
     print "\n".join(toPrint)
-    print "Zipped into to-epoc.zip for transfer to the device"
-if also_make_HTML_files: os.system("echo zipping HTML files... && find . -maxdepth 1 -name '*.png' -o -name '*.html' | xargs zip -9q htmlfiles.zip && find . -maxdepth 1 '(' -name '*.png' -o -name '*.html' ')' -exec rm '{}' ';' && echo Made htmlfiles.zip")
-if also_make_compressed_XBM:
-    i=0 ; dat=[]
-    while True:
-        try:
-          dat.append(zlib.compress(open(("%08d.xbm" % i),"rb").read()))
-          os.remove("%08d.xbm" % i)
-        except: break
-        i += 1
-    o=open("images.dat","wb")
-    offset=4*(len(dat)+1)
-    def writeOffset(o,offset): o.write(chr(offset&255)+chr((offset>>8)&255)+chr((offset>>16)&255)+chr((offset>>24)&255))
-    for d in dat:
-          writeOffset(o,offset)
-          offset += len(d)
-    writeOffset(o,offset)
-    for d in dat: o.write(d)
-    print "Made images.dat (compressed XBM for XBMshow.py)"
+    print "Zipped each bundle for transfer to the device"
+else:
+    if ContentsNotNeeded:
+        toPrint.append("Didn't make contents.dat, as there was only one input document")
+        os.remove("contents.dat")
+    else:
+        toPrint.append("Made contents.dat")
+        toZip.append("contents.dat")
+        AllUnique = False # because we DO make sequence.dat if we made contents.dat
+    if AllUnique:
+        toPrint.append("Didn't make sequence.dat, as all images were unique")
+        os.remove("sequence.dat")
+    else:
+        toPrint.append("Made sequence.dat")
+        toZip.append("sequence.dat")
+    if just_print_Bmconv_commands:
+        print "\n".join(toPrint)
+        print "Made bmconv commands (which should be run using the *.bmp files in %s)" % (tempDir,)
+    else:
+        os.system("rm -rf \"%s\"" % (tempDir,))
+        toPrint.append("Made "+baseFilename+"*.mbm")
+        toZip.append(baseFilename+"*.mbm")
+        assert not " " in baseFilename, "you'll be sorry..."
+        times.call("zip","zip -9 to-epoc.zip "+" ".join(toZip)+" && rm "+" ".join(toZip))
+        times.add("zip",written=sizeOf(["to-epoc.zip"]),items=1)
+        print "\n".join(toPrint)
+        print "Zipped into to-epoc.zip for transfer to the device"
+if also_make_HTML_files:
+    times.call("zip","echo zipping HTML files... && find . -maxdepth 1 -name '*.png' -o -name '*.html' | xargs zip -9q htmlfiles.zip && find . -maxdepth 1 '(' -name '*.png' -o -name '*.html' ')' -exec rm '{}' ';' && echo Made htmlfiles.zip")
+    times.add("zip",written=sizeOf(["htmlfiles.zip"]),items=1)
+if also_make_compressed_XBM: print "Made images.dat (compressed XBM for XBMshow.py)"
+if timing_report:
+    times.write(timing_report)
+    print "Wrote stage timings to "+timing_report
@@ -24,6 +24,16 @@ device_resolution = (640, 480)  # for S7
 # bmconv_command = "Bmconv.exe"
 bmconv_command = "wine Bmconv.exe"
 
+use_bmconv = True # if False, the .mbm files are written
+# by this script (see mbmfile.py) and bmconv_command
+# is not needed.  That's checked only against a file put
+# together by hand (test_mbmfile.py), not yet against files
+# made by Bmconv, so it's not the default yet.
+compress_mbm = False # if True (and not use_bmconv),
+# use EPOC's byte run-length compression in the .mbm files
+glyphs_per_mbm = 510 # MbmShow expects 510 per file (and
+# Bmconv can't take more)
+
 # The following variables are used for setting the
 # font size etc of TeX files, and are ignored for
 # .ps files which the program assumes are already
@@ -59,6 +69,10 @@ ps_input_is_Whole_Slides = True # if True, assumes that,
 # and .pdf) are whole slides not 1 line only.  Set this
 # to False if the .ps files are from a just_make_PS run.
 
+files_in_flight = 2 # number of input files to work on
+# at once (the next is typeset and rasterised while the
+# last one's images are examined)
+
 just_print_Bmconv_commands = False # if non-False,
 # should be open("some-file","w") - will just
 # print the bmconv.exe commands to that file,
@@ -69,6 +83,30 @@ just_print_Bmconv_commands = False # if non-False,
 # does not have bmconv.exe on it, and you want
 # to run bmconv.exe later.
 
+bmconv_processes = 0 # number of bmconv batches (of up
+# to 510 images) to run at once (0 = one per CPU)
+
+also_make_compressed_XBM = False # if True, also makes
+# images.dat (black and white) for XBMshow.py
+compressed_XBM_format = 1 # 2 for an images.dat about
+# half the size, but each glyph then takes XBMshow.py
+# 2-10 times as long to decode (and XBMshow.py versions
+# before datfiles.py can't read it at all)
+
+documents_per_bundle = 0 # if non-zero, the output is
+# split into bundle001, bundle002 etc of this many input
+# files each, with only the glyphs those files use, so
+# each bundle for the device can be kept small
+
+origin_cache = None # a file to remember latex-papersize's
+# measurements in (e.g. "~/.latex-papersize-cache"), so
+# running the same input again needn't measure it again
+
+timing_report = "tex2mbm-timings.json" # time, CPU,
+# bytes written and items done by each stage (latex,
+# dvips, gs, examine, classify, mbm or bmconv, zip etc),
+# in JSON (None = don't write it)
+
 # --- End of variables that need changing -----
 
 # Licensed under the Apache License, Version 2.0 (the "License");
@@ -90,9 +128,19 @@ just_print_Bmconv_commands = False # if non-False,
 # and at https://gitlab.developers.cam.ac.uk/ssb22/scan-reflow
 # and in China: https://gitee.com/ssb22/scan-reflow
 
-import os, sys, zlib
+import os, sys, imp, zlib, shutil, threading
+from multiprocessing.pool import ThreadPool
+from datfiles import SequenceWriter, ImagesDatWriter
+from pagebitmaps import makePool, remapPage, writeBMP, bmconvFlag, ppm, epoc16, xbmGlyphFromPPM
+from mbmfile import mbmBitmap, writeMBM
+from stagetimes import StageTimes, sizeOf
+from bundles import makeBundles
+times = StageTimes()
 
 baseFilename = "font"
+if use_bmconv: glyphs_per_mbm = min(glyphs_per_mbm,510)
+else: just_print_Bmconv_commands = False
+assert not (documents_per_bundle and just_print_Bmconv_commands), "documents_per_bundle needs the .mbm files, so can't be used with just_print_Bmconv_commands"
 if not ".tex" in ''.join(sys.argv):
     startString = None
     if ps_input_is_Whole_Slides:
@@ -104,136 +152,192 @@ papersize_px = (device_resolution[0],device_resolution[1]/lines_per_screen)
 fontsize_px = papersize_px[1] / max_symbol_height
 fontsize_pt = fontsize_px * 72.0 / dpi_to_set_at
 papersize_mm = tuple(map(lambda x: x*25.4/dpi_to_set_at, papersize_px))
-latex_paper_command = "margin_left=0 margin_top=0 paper_width="+str(papersize_mm[0])+" paper_height="+str(papersize_mm[1])+" python \""+path_to_latexPapersize+"\" "+str(baseSize_points)+" "+str(fontsize_pt)+" "
 
 if ".tex" in ''.join(sys.argv):
     # (note: don't need to do this if we're dealing with only .ps files)
     assert open(path_to_latexPapersize), "path_to_latexPapersize does not appear to be set properly" # (more likely to raise IOError than AssertionError, but still)
-    startString = documentClass + os.popen(latex_paper_command+"tex").read()
+    t = times.start()
+    latexPapersize = imp.load_source("latex_papersize",path_to_latexPapersize) # (in-process, rather than a new Python for every call)
+    paperGeometry = latexPapersize.geometry(baseSize_points,fontsize_pt,papersize_mm[0],papersize_mm[1],0,0)
+    startString = documentClass + latexPapersize.texSettings(paperGeometry) + "\n" # (as it was when printed)
+    times.stop("latex-papersize",t)
     startString += "\\usepackage[T1]{fontenc}" # hack to ensure uses bitmaps not outlines in teTeX 2 (not needed in teTeX 1) (TODO: will it work in teTeX 3?)
 
 tempDir = os.popen("mktemp -d").read().strip()
 
 datToCharNo = {} ; charNoToDat = {} # maps between bitmap data and character number
 bmconv_params = []
-if just_make_PS: seq=contents=None
-else:
-    seq=open("sequence.dat","w")
-    contents = open("contents.dat","w")
+if just_make_PS: seq = None
+else: seq = SequenceWriter() # (sequence.dat and contents.dat)
 
 oldDir = os.getcwd()
+jobs = [] # (input file, dpi)
 for inputFile in sys.argv[1:]:
-    try: dat = open(inputFile).read()
-    except IOError: dat = "" # the argument might be a scale factor, see below
-    os.chdir(tempDir)
-    gsInput = "tmp.ps"
-    if inputFile.endswith(".tex"):
-        for thing in "documentclass textwidth textheight topmargin marginparwidth oddsidemargin evensidemargin".split(): assert not "\\"+thing in dat, "TeX files must NOT contain \\"+thing+" (this will be added by the script)"
-        os.system("rm -f tmp.*")
-        open("tmp.tex","w").write(startString+dat)
-        ret = os.system("latex tmp.tex")
-        assert not ret, "TeX error"
-        ret = os.system(os.popen(latex_paper_command+"tmp.dvi").read().strip()+" -o tmp.ps -D "+str(dpi_to_set_at))
-        assert not ret, "dvips error"
-    elif inputFile.endswith(".ps") or inputFile.endswith(".pdf"):
-        if inputFile.endswith(".pdf"): gsInput="tmp.pdf"
-        open(gsInput,"w").write(dat)
+    if inputFile.endswith(".tex") or inputFile.endswith(".ps") or inputFile.endswith(".pdf"): jobs.append((inputFile,dpi_to_set_at))
     else:
         try: i=float(inputFile)
         except: i=0
         if i: # an extra scale factor for .ps input
             assert not ".tex" in " ".join(sys.argv[1:]), "Scale factors on the command line should be used only with .ps or .pdf input.  For scaling .tex input, change the variables at the start of the script."
             dpi_to_set_at *= i # papersize is already ok
-            os.chdir(oldDir) ; continue
         else: assert 0, "Extension of filename '"+inputFile+"' not supported"
+
+def render(inputFile,dpi,workDir):
+    # Typeset (if needed) and rasterise inputFile in its own
+    # directory; returns the PNG files.  Runs in a thread of
+    # its own, so the next file can be done while the main
+    # thread is examining the last one's PNGs.
+    def run(stage,cmd): return times.call(stage,cmd,workDir)
+    def tmp(f): return workDir+os.sep+f
+    dat = open(inputFile).read()
+    gsInput = "tmp.ps"
+    if inputFile.endswith(".tex"):
+        for thing in "documentclass textwidth textheight topmargin marginparwidth oddsidemargin evensidemargin".split(): assert not "\\"+thing in dat, "TeX files must NOT contain \\"+thing+" (this will be added by the script)"
+        open(tmp("tmp.tex"),"w").write(startString+dat)
+        assert not run("latex","latex tmp.tex"), "TeX error"
+        times.add("latex",written=sizeOf([tmp("tmp.dvi")]),items=1)
+        t = times.start() ; dvips = latexPapersize.dvipsCommand(paperGeometry,tmp("tmp.dvi"),cacheFile=origin_cache) ; times.stop("latex-papersize",t)
+        assert not run("dvips",dvips+" -o tmp.ps -D "+str(dpi)), "dvips error"
+        times.add("dvips",written=sizeOf([tmp("tmp.ps")]),items=1)
+    else:
+        if inputFile.endswith(".pdf"): gsInput="tmp.pdf"
+        open(tmp(gsInput),"w").write(dat)
     if just_make_PS:
-        # just copy that .ps out, clean up, and don't do any more
-        open(oldDir+os.sep+inputFile[:inputFile.rfind(".")]+".ps","w").write(open("tmp.ps").read())
-        os.system("rm *") ; os.chdir(oldDir)
-        continue
-    # otherwise go ahead and make the bitmaps
-    print "Running gs to get PNGs"
-    ret = os.system("gs -sDEVICE=png16m -sOutputFile=tmp%%08d.png -g%dx%d -r%dx%d -q -dNOPAUSE - < %s" % (papersize_px[0],papersize_px[1],dpi_to_set_at,dpi_to_set_at,gsInput)) # need to write to png16m to stop awful dithering from some source PDFs when writing to png16 (e.g. Seamonkey output)
-    assert not ret, "gs error"
+        # just copy that .ps out, and don't do any more
+        open(oldDir+os.sep+inputFile[:inputFile.rfind(".")]+".ps","w").write(open(tmp("tmp.ps")).read())
+        return []
+    print "Running gs to get PNGs from "+inputFile
+    assert not run("gs","gs -sDEVICE=png16m -sOutputFile=tmp%%08d.png -g%dx%d -r%dx%d -q -dNOPAUSE - < %s" % (papersize_px[0],papersize_px[1],dpi,dpi,gsInput)), "gs error" # need to write to png16m to stop awful dithering from some source PDFs when writing to png16 (e.g. Seamonkey output)
+    pngs = [tmp(f) for f in sorted(os.listdir(workDir)) if f.endswith(".png")]
+    times.add("gs",written=sizeOf(pngs),items=len(pngs))
+    return pngs
+
+def startJob(jobNo):
+    workDir = tempDir+os.sep+("%05d" % jobNo) ; os.mkdir(workDir)
+    results[jobNo] = []
+    def renderJob(result=results[jobNo]):
+        try: result.append(render(jobs[jobNo][0],jobs[jobNo][1],workDir))
+        except: result.append(sys.exc_info()[1]) # (raised again in the main thread)
+    threads[jobNo] = threading.Thread(target=renderJob)
+    threads[jobNo].start()
+
+pool = makePool() # (before starting any threads)
+open(tempDir+os.sep+"epoc16","wb").write(ppm(epoc16))
+results = {} ; threads = {}
+for jobNo in range(min(files_in_flight,len(jobs))): startJob(jobNo)
+for jobNo in range(len(jobs)):
+    threads[jobNo].join() ; del threads[jobNo]
+    pngs = results.pop(jobNo)[0]
+    if isinstance(pngs,Exception): raise pngs
     # Now look at those PNG files and add to the sequence ('seq') :
-    print "Examining PNGs"
-    def lsbmsb16(num): return chr(num%256)+chr(num/256)
-    def lsbmsb32(num): return lsbmsb16(num%65536)+lsbmsb16(num/65536)
-    if contents: contents.write(lsbmsb32(seq.tell()))
-    pngs = os.listdir(os.getcwd()) ; pngs.sort()
-    open("epoc16","w").write('P6\n16 1\n255\n\x00\x00\x00\x00\xff\xff\x00\xff\x00UUU\x88\x00\x00\x00\x00\x88\xaa\xaa\xaa\xff\x00\xff\xff\x00\x00\x99\x99\x00\x00\x99\x99\x99\x00\x99\xff\xff\xff\xff\xff\x00\x00\x88\x00\x00\x00\xff') # the 16 colours used by Sketch on S7 - probably safest to keep to those
-    open("epoc2","w").write('P6\n2 1\n255\n\x00\x00\x00\xff\xff\xff') # black & white
-    open("epoc4","w").write('P6\n4 1\n255\n\x00\x00\x00UUU\xaa\xaa\xaa\xff\xff\xff') # 4 greys
-    for f in pngs:
-        if not f.endswith(".png"): continue # ignore
-        dat=os.popen('pngtopnm "'+f+'" | pnmcrop -white -left -right -bottom | pnmremap -nofs -mapfile=epoc16 2>/dev/null').read() # (don't crop top because we're using it for alignment)
-        if not dat: continue # maybe it was a blank page (pnmcrop error) - ignore it
+    if seq: seq.startDoc()
+    if pngs: print "Examining PNGs from "+jobs[jobNo][0]
+    for dat in times.imap("examine",pool,remapPage,[(f,tempDir+os.sep+"epoc16") for f in pngs],8): # (in parallel, but in order)
+        if not dat: continue # maybe it was a blank page - ignore it
+        times.add("examine",written=len(dat))
         compressed_dat = zlib.compress(dat,9) # save VM
         if not datToCharNo.has_key(compressed_dat): # new image
-            # work out how many colours we need.  Don't use P6/P5/P4 because it often overstates things.
-            os.popen("pnmremap -nofs -mapfile=epoc4 2>/dev/null | pnmremap -nofs -mapfile=epoc16 >testfile 2>/dev/null","wb").write(dat)
-            if open("testfile").read()==dat:
-                # Can at least take it down to greymap.  B&W ?
-                os.popen("pnmremap -nofs -mapfile=epoc2 2>/dev/null | pnmremap -nofs -mapfile=epoc16 >testfile 2>/dev/null","wb").write(dat)
-                if open("testfile").read()==dat: flag="/1" # B&W
-                else: flag="/2" # grey
-            else: flag="/c4" # 16 colours
+            t = times.start()
+            flag = bmconvFlag(dat) # how many colours we need.  Don't use P6/P5/P4 because it often overstates things.
+            times.stop("classify",t,items=1)
             fname="%08d.bmp" % len(datToCharNo)
             bmconv_params.append(flag+fname)
             charNoToDat[len(datToCharNo)]=compressed_dat
             datToCharNo[compressed_dat]=len(datToCharNo)
-        seq.write(lsbmsb16(datToCharNo[compressed_dat]))
-        if contents: docs=contents.tell()/4
-        else: docs=1
-        print "Docs="+str(docs),"chars="+str(seq.tell()/2),"unique="+str(len(datToCharNo))
-    os.system("rm *") ; os.chdir(oldDir)
+        seq.add([datToCharNo[compressed_dat]])
+        print "Docs="+str(len(seq.contents)),"chars="+str(seq.count),"unique="+str(len(datToCharNo))
+    shutil.rmtree(tempDir+os.sep+("%05d" % jobNo))
+    if jobNo+files_in_flight < len(jobs): startJob(jobNo+files_in_flight)
 
 if just_make_PS:
     os.system("rm -rf \"%s\"" % (tempDir,))
+    if timing_report: times.write(oldDir+os.sep+timing_report)
     print "Made *.ps files - you now need to run this script on a more powerful machine, with just_make_PS and ps_input_is_Whole_Slides both set to False"
     sys.exit()
 
-AllUnique = (seq.tell()/2 == len(datToCharNo))
-ContentsNotNeeded = (contents.tell() == 4) # only 1 document
-del datToCharNo, contents, seq
+AllUnique = (seq.count == len(datToCharNo))
+ContentsNotNeeded = (len(seq.contents) == 1) # only 1 document
+seq.close()
+del datToCharNo, seq
 # Finish by doing the conversion to MBM from the in-memory unique bitmaps :
-startPoints=range(0,len(bmconv_params),510)+[len(bmconv_params)]
+startPoints=range(0,len(bmconv_params),glyphs_per_mbm)+[len(bmconv_params)]
 # (note that bmconv can't take more than 510 slides at a time - confirmed by using short filenames that this limit is in number of slides, not in number of characters on the command line)
-os.chdir(tempDir)
+# (each batch is converted in its own directory, several at once)
+batches = []
 for i in range(len(startPoints)-1):
-    for charNo in range(startPoints[i],startPoints[i+1]): os.popen("ppmtobmp > %08d.bmp" % (charNo,),"w").write(zlib.decompress(charNoToDat[charNo]))
+    if not use_bmconv:
+        if i==0: extra=""
+        else: extra=hex(i)[2:].upper()
+        bitmaps = list(times.imap("mbm",pool,mbmBitmap,[(zlib.decompress(charNoToDat[charNo]),bmconv_params[charNo][:-12],compress_mbm) for charNo in range(startPoints[i],startPoints[i+1])])) # (bmconv_params has the flag then %08d.bmp)
+        t = times.start() ; mbm = oldDir+os.sep+baseFilename+extra+".mbm"
+        writeMBM(mbm,bitmaps) ; del bitmaps
+        times.stop("mbm",t,written=sizeOf([mbm]))
+        continue
+    if just_print_Bmconv_commands: batchDir = tempDir
+    else:
+        batchDir = tempDir+os.sep+("batch%d" % i) ; os.mkdir(batchDir)
+    t = times.start()
+    for charNo in range(startPoints[i],startPoints[i+1]): writeBMP(zlib.decompress(charNoToDat[charNo]),batchDir+os.sep+("%08d.bmp" % (charNo,)))
+    times.stop("bmp",t,written=sizeOf([batchDir+os.sep+("%08d.bmp" % (charNo,)) for charNo in range(startPoints[i],startPoints[i+1])]),items=startPoints[i+1]-startPoints[i])
     if i==0: extra=""
     else: extra=hex(i)[2:].upper() # (drop '0x' at beginning)
     this_cmd = bmconv_command+" "+baseFilename+extra+".mbm "+' '.join(bmconv_params[startPoints[i]:startPoints[i+1]])
     if just_print_Bmconv_commands: just_print_Bmconv_commands.write(this_cmd+"\n")
-    else: 
-        ret=os.system(this_cmd)
-        assert not ret, "bmconv_command exitted with an error"
-        os.system("mv "+baseFilename+extra+".mbm \""+oldDir+"\" ; rm *")
-os.chdir(oldDir)
+    else: batches.append((this_cmd,batchDir,baseFilename+extra+".mbm"))
+if also_make_compressed_XBM: # (written as the glyphs come, so there's only ever a few in memory)
+    images = ImagesDatWriter(oldDir+os.sep+"images.dat",compressed_XBM_format,len(charNoToDat))
+    for w,h,rows in times.imap("images.dat",pool,xbmGlyphFromPPM,(zlib.decompress(charNoToDat[charNo]) for charNo in xrange(len(charNoToDat))),8): images.add(w,h,rows)
+    images.close() ; times.add("images.dat",written=sizeOf([oldDir+os.sep+"images.dat"]))
+del charNoToDat
+pool.close()
+def runBmconv(batch):
+    ret = times.call("bmconv",batch[0],batch[1])
+    times.add("bmconv",written=sizeOf([batch[1]+os.sep+batch[2]]),items=1)
+    return ret
+if batches:
+    bmconvPool = ThreadPool(bmconv_processes or None) # (threads are enough: the work is in the bmconv processes)
+    for ret in bmconvPool.map(runBmconv,batches): assert not ret, "bmconv_command exitted with an error"
+    bmconvPool.close()
+for this_cmd,batchDir,mbm in batches:
+    shutil.move(batchDir+os.sep+mbm,oldDir+os.sep+mbm)
+    shutil.rmtree(batchDir)
 # clean up, zip, print report
 toPrint = ["\n--------------------------"] ; toZip = []
-if not ContentsNotNeeded:
-    toPrint.append("Made contents.dat")
-    toZip.append("contents.dat")
-    AllUnique = False # because we DO make sequence.dat if we made contents.dat
-else:
-    toPrint.append("Didn't make contents.dat, as there was only one input document")
-    os.remove("contents.dat")
-    if AllUnique:
-        toPrint.append("Didn't make sequence.dat, as all images were unique")
-        os.remove("sequence.dat")
-if not AllUnique:
-    toPrint.append("Made sequence.dat")
-    toZip.append("sequence.dat")
-if just_print_Bmconv_commands:
-    print "\n".join(toPrint)
-    print "Made bmconv commands (which should be run using the *.bmp files in %s)" % (tempDir,)
-else:
+if documents_per_bundle: # (each bundle zipped on its own)
     os.system("rm -rf \"%s\"" % (tempDir,))
-    toPrint.append("Made "+baseFilename+"*.mbm")
-    toZip.append(baseFilename+"*.mbm")
-    assert not " " in baseFilename, "you'll be sorry..."
-    os.system("zip -9 to-epoc.zip "+" ".join(toZip)+" && rm "+" ".join(toZip))
+    for bundleDir,files in makeBundles(baseFilename,documents_per_bundle,glyphs_per_mbm,oldDir):
+        times.call("zip","zip -9 to-epoc.zip "+" ".join(files)+" && rm "+" ".join(files),bundleDir)
+        times.add("zip",written=sizeOf([bundleDir+os.sep+"to-epoc.zip"]),items=1)
+        toPrint.append("Made "+bundleDir+os.sep+"to-epoc.zip ("+", ".join(files)+")")
     print "\n".join(toPrint)
-    print "Zipped into to-epoc.zip for transfer to the device"
+    print "Zipped each bundle for transfer to the device"
+else:
+    if not ContentsNotNeeded:
+        toPrint.append("Made contents.dat")
+        toZip.append("contents.dat")
+        AllUnique = False # because we DO make sequence.dat if we made contents.dat
+    else:
+        toPrint.append("Didn't make contents.dat, as there was only one input document")
+        os.remove("contents.dat")
+        if AllUnique:
+            toPrint.append("Didn't make sequence.dat, as all images were unique")
+            os.remove("sequence.dat")
+    if not AllUnique:
+        toPrint.append("Made sequence.dat")
+        toZip.append("sequence.dat")
+    if just_print_Bmconv_commands:
+        print "\n".join(toPrint)
+        print "Made bmconv commands (which should be run using the *.bmp files in %s)" % (tempDir,)
+    else:
+        os.system("rm -rf \"%s\"" % (tempDir,))
+        toPrint.append("Made "+baseFilename+"*.mbm")
+        toZip.append(baseFilename+"*.mbm")
+        assert not " " in baseFilename, "you'll be sorry..."
+        times.call("zip","zip -9 to-epoc.zip "+" ".join(toZip)+" && rm "+" ".join(toZip))
+        times.add("zip",written=sizeOf(["to-epoc.zip"]),items=1)
+        print "\n".join(toPrint)
+        print "Zipped into to-epoc.zip for transfer to the device"
+if also_make_compressed_XBM: print "Made images.dat (compressed XBM for XBMshow.py)"
+if timing_report:
+    times.write(timing_report)
+    print "Wrote stage timings to "+timing_report